@@ -1,2 +1,2 @@
-python /Users/adds68/sumo-0.28.0/tools/randomTrips.py -n osm.net.xml --seed 42 --fringe-factor 5 -p 1.195753 -r osm.passenger.rou.xml -o osm.passenger.trips.xml -e 1000 --vehicle-class passenger --vclass passenger --prefix veh --min-distance 300 --trip-attributes 'departLane="best"' --validate
-python /Users/adds68/sumo-0.28.0/tools/randomTrips.py -n osm.net.xml --seed 42 --fringe-factor 5 -p 2.391507 -r osm.bus.rou.xml -o osm.bus.trips.xml -e 1000 --vehicle-class bus --vclass bus --prefix bus --min-distance 600 --trip-attributes 'departLane="best"' --validate
+set PYTHONPATH=..
+python -m sumosim.build manchester
@@ -0,0 +1,28 @@
+"""Shared runner for the priority lane ("cognitive radio") SUMO scenarios.
+
+Every scenario directory declares its files in a scenario.json, see
+sumosim.scenarios. The simulation loop lives in sumosim.runner and the
+priority lane algorithm in sumosim.controller.
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+if "SUMO_HOME" in os.environ:
+    sys.path.append(os.path.join(os.environ["SUMO_HOME"], "tools"))
+
+
+def find_binary(name):
+    """Returns the path of a SUMO binary (duarouter, netconvert, ...) from
+    $SUMO_HOME/bin or the PATH, or None if it is not installed"""
+    if "SUMO_HOME" in os.environ:
+        binary = os.path.join(os.environ["SUMO_HOME"], "bin", name)
+        if os.path.exists(binary) or os.path.exists(binary + ".exe"):
+            return binary
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        for binary in (os.path.join(directory, name), os.path.join(directory, name + ".exe")):
+            if os.path.isfile(binary) and os.access(binary, os.X_OK):
+                return binary
+    return None
@@ -0,0 +1,74 @@
+"""Per-step queue of the writes the controller sends to SUMO.
+
+The algorithm used to send setAllowed, changeLane, adaptTraveltime and
+rerouteTraveltime as soon as it decided on them, in between its queries.
+The CommandQueue collects them while the controller decides instead and
+sends them in one batch at the end of its step, right before the simulation
+step. A command replaces the queued command of the same kind for the same
+lane, edge or vehicle, the last write wins, so nothing is sent that a later
+decision of the same step overrides. The commands are sent in the order they
+were last queued.
+"""
+from __future__ import absolute_import
+
+from sumosim.backend import traci
+
+
+class CommandQueue(object):
+    """The writes of the current step, one per kind and target.
+
+    'issued' counts the commands sent, 'suppressed' the ones replaced before
+    they were sent and 'failed' the ones queued with 'may_fail' that SUMO
+    refused, like a reroute of a vehicle that left the network"""
+
+    def __init__(self):
+        # (kind, target) -> (function, args, may_fail), insertion ordered
+        self.commands = {}
+        self.issued = 0
+        self.suppressed = 0
+        self.failed = 0
+        self.steps = 0
+        self.peak = 0
+
+    def put(self, kind, target, function, args, may_fail=False):
+        """Queues function(*args) as the 'kind' write of 'target'"""
+        key = (kind, target)
+        if key in self.commands:
+            # moved to the end, after the commands queued since
+            del self.commands[key]
+            self.suppressed += 1
+        self.commands[key] = (function, args, may_fail)
+
+    def flush(self):
+        """Sends the queued commands, returns the number sent"""
+        commands = self.commands
+        self.commands = {}
+        for function, args, may_fail in commands.values():
+            if may_fail:
+                try:
+                    function(*args)
+                except traci.TraCIException:
+                    self.failed += 1
+            else:
+                function(*args)
+        self.issued += len(commands)
+        self.steps += 1
+        self.peak = max(self.peak, len(commands))
+        return len(commands)
+
+    def stats(self):
+        return {
+            'commands_issued': self.issued,
+            'commands_suppressed': self.suppressed,
+            'commands_failed': self.failed,
+            'commands_per_step': round(self.issued / float(self.steps), 3) if self.steps else 0.,
+            'commands_peak_step': self.peak,
+        }
+
+
+def submit(commands, kind, target, function, *args):
+    """Queues the write on 'commands', or sends it at once without a queue"""
+    if commands is None:
+        function(*args)
+    else:
+        commands.put(kind, target, function, args)
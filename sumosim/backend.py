@@ -0,0 +1,75 @@
+"""The SUMO binding the control code talks to.
+
+    traci    SUMO runs in its own process and every call is a round trip
+             over the TraCI socket, needed for sumo-gui and parallel runs
+             with ports and labels
+    libsumo  SUMO runs inside this process behind the same API, without the
+             socket serialization, headless only
+
+The modules of this package use the 'traci' object of this module instead of
+the traci package, so the same control code runs on either binding. It
+forwards to the binding chosen with select, TraCI until then.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys
+
+import traci as _traci
+
+BACKENDS = ('traci', 'libsumo')
+
+
+class Binding(object):
+    """Forwards attribute lookups to the selected binding module. Attributes
+    set on it, like the wrappers of the instrumentation, shadow the module's"""
+
+    def __init__(self, module):
+        self.__dict__['_module'] = module
+        self.__dict__['name'] = 'traci'
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+    def use(self, name, module):
+        self.__dict__.clear()
+        self.__dict__['_module'] = module
+        self.__dict__['name'] = name
+
+
+traci = Binding(_traci)
+
+
+def load_libsumo():
+    """Returns the libsumo module or None if it is not installed"""
+    try:
+        import libsumo
+    except ImportError:
+        return None
+    return libsumo
+
+
+def select(name='traci', gui=False):
+    """Switches to the named binding and returns the name of the one used,
+    falling back to TraCI when libsumo is not installed or a GUI is wanted"""
+    if name not in BACKENDS:
+        raise ValueError("unknown backend '{0}', expected one of {1}".format(name, ', '.join(BACKENDS)))
+    if name == 'libsumo':
+        module = load_libsumo()
+        if module is None or gui:
+            print("libsumo is {0}, using TraCI".format(
+                "not installed" if module is None else "headless only"), file=sys.stderr)
+        else:
+            traci.use(name, module)
+            return name
+    traci.use('traci', _traci)
+    return 'traci'
+
+
+def start(cmd, port=None, label="default"):
+    """Starts SUMO with the selected binding"""
+    if traci.name == 'libsumo':
+        # in process, there is neither a port nor more than one connection
+        traci.start(cmd)
+    else:
+        traci.start(cmd, port=port, label=label)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+"""Reproducible benchmark of the scenarios with and without the algorithm.
+
+    python -m sumosim.benchmark --record benchmark.json
+    python -m sumosim.benchmark --compare benchmark.json
+    python -m sumosim.benchmark --scenarios grid-4,grid-10 --backends traci,libsumo
+
+Every scenario x variant x backend runs one seed, one after the other, each
+in a fresh worker process so the peak RSS is that of the run alone. For every
+run the wall time, steps/s, TraCI calls per step, peak RSS of the controller
+and of SUMO (kB on Linux) and the mean of the main tripinfo metrics over all
+trips are recorded. The TraCI calls are counted by sumosim.instrumentation
+in every run, so its small overhead is part of all timings alike.
+
+--record writes the results to a JSON baseline file. --compare flags runs
+that got slower or bigger than the baseline by more than the tolerances, or
+whose metrics changed, and exits with 1 if any did. The trips of every
+backend are checked against those of the first one, as the bindings must not
+change the results. The 'kernel' variant runs the algorithm with the
+vectorized decision kernel and its trips are checked against the
+'algorithm' ones, as the kernel must not change the results either. The
+'event' variant runs the algorithm on the event schedule of
+sumosim.scheduling, which may open lanes later and so change the trips.
+
+    python -m sumosim.benchmark --scenarios grid-10,manchester --variants algorithm,kernel
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import json
+import time
+import optparse
+import traceback
+import multiprocessing
+
+try:
+    import resource
+except ImportError:
+    # not on Windows, the peak RSS is not recorded there
+    resource = None
+
+from sumosim import scenarios
+from sumosim import runner
+from sumosim.backend import BACKENDS, load_libsumo
+from sumosim.metrics import ALL, METRICS, iter_tripinfos, summarize_tripinfo
+from sumosim.instrumentation import Instrumentation
+from sumosim.progress import QUIET, ProgressReporter
+
+VARIANTS = ('algorithm', 'no-algorithm', 'kernel', 'event')
+DEFAULT_VARIANTS = ('algorithm', 'no-algorithm')
+# variant -> variant whose trips it must reproduce
+SAME_TRIPS = {'kernel': 'algorithm'}
+SPEED = 'steps_per_s'
+MEMORY = ('peak_rss_controller', 'peak_rss_sumo')
+
+
+def run_key(result):
+    return '{0}/{1}/{2}'.format(result['scenario'], result['variant'], result['backend'])
+
+
+def peak_rss():
+    """Returns the peak RSS of this process and of its finished children"""
+    if resource is None:
+        return None, None
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def run_benchmark(job):
+    """Runs one benchmark job in a worker, returns its result"""
+    scenario, variant, backend, seed = job
+    algorithm = variant != 'no-algorithm'
+    tag = 'bench-' + backend if variant in ('algorithm', 'no-algorithm') \
+        else 'bench-{0}-{1}'.format(variant, backend)
+    result = {'scenario': scenario.name, 'variant': variant, 'backend': backend, 'seed': seed}
+    try:
+        reporter = ProgressReporter(verbosity=QUIET)
+        instrumentation = Instrumentation()
+        output_file = runner.run(
+            scenario, seed, algorithm,
+            output_file=scenario.output_file(algorithm, seed, tag=tag),
+            reporter=reporter, backend=backend, instrumentation=instrumentation,
+            controller_options={'decision_kernel': variant == 'kernel'},
+            schedule_options={'mode': 'event'} if variant == 'event' else None)
+    except (Exception, SystemExit):
+        result['error'] = traceback.format_exc()
+        return result
+    controller_rss, sumo_rss = peak_rss()
+    if backend == 'libsumo':
+        # SUMO ran inside this process
+        controller_rss, sumo_rss = None, controller_rss
+    trips = summarize_tripinfo(output_file).get(ALL, {})
+    result.update({
+        'output': output_file,
+        'steps': reporter.steps,
+        'wall': reporter.wall,
+        'steps_per_s': reporter.steps / reporter.wall if reporter.wall else 0.,
+        'calls_per_step': instrumentation.summary()['calls_per_step'],
+        'peak_rss_controller': controller_rss,
+        'peak_rss_sumo': sumo_rss,
+        'trips': trips['duration']['count'] if 'duration' in trips else 0,
+        'metrics': dict((metric, trips[metric]['mean']) for metric in METRICS if metric in trips),
+    })
+    return result
+
+
+def same_trips(output_file, other_file):
+    """Returns whether both tripinfo outputs hold the same trips"""
+    return list(iter_tripinfos(output_file)) == list(iter_tripinfos(other_file))
+
+
+def compare(result, baseline, speed_tolerance, memory_tolerance, metric_tolerance):
+    """Returns the regressions of a result against its baseline as text"""
+    problems = []
+    if baseline[SPEED] and result[SPEED] < baseline[SPEED] * (1 - speed_tolerance):
+        problems.append("{0} {1:.1f} < {2:.1f}".format(SPEED, result[SPEED], baseline[SPEED]))
+    for field in MEMORY:
+        if result.get(field) and baseline.get(field) and \
+                result[field] > baseline[field] * (1 + memory_tolerance):
+            problems.append("{0} {1} > {2}".format(field, result[field], baseline[field]))
+    for metric, before in sorted(baseline['metrics'].items()):
+        after = result['metrics'].get(metric)
+        if after is None or abs(after - before) > metric_tolerance * abs(before):
+            problems.append("{0} {1} != {2}".format(metric, after, before))
+    return problems
+
+
+def get_options(args=None):
+    known = scenarios.load_scenarios()
+    optParser = optparse.OptionParser()
+    optParser.add_option("--scenarios", default=','.join(sorted(known)),
+                         help="comma separated scenarios to run [default: %default]")
+    optParser.add_option("--variants", default=','.join(DEFAULT_VARIANTS),
+                         help="comma separated variants to run, of {0} [default: %default]".format(
+                             ', '.join(VARIANTS)))
+    optParser.add_option("--backends", default='traci',
+                         help="comma separated backends to run, of {0} [default: %default]".format(
+                             ', '.join(BACKENDS)))
+    optParser.add_option("--seed", type="int",
+                         help="seed to run [default: each scenario's first seed]")
+    optParser.add_option("--record", help="write the results to this baseline file")
+    optParser.add_option("--compare", help="compare the results with this baseline file")
+    optParser.add_option("--speed-tolerance", type="float", default=0.1,
+                         help="relative steps/s loss flagged as a regression [default: %default]")
+    optParser.add_option("--memory-tolerance", type="float", default=0.2,
+                         help="relative peak RSS growth flagged as a regression [default: %default]")
+    optParser.add_option("--metric-tolerance", type="float", default=0.,
+                         help="relative change of a trip metric flagged [default: %default]")
+    options, args = optParser.parse_args(args)
+    for name in options.scenarios.split(','):
+        if name not in known:
+            optParser.error("unknown scenario '{0}'".format(name))
+    for variant in options.variants.split(','):
+        if variant not in VARIANTS:
+            optParser.error("unknown variant '{0}'".format(variant))
+    for backend in options.backends.split(','):
+        if backend not in BACKENDS:
+            optParser.error("unknown backend '{0}'".format(backend))
+    options.scenarios = [known[name] for name in options.scenarios.split(',')]
+    options.variants = options.variants.split(',')
+    options.backends = options.backends.split(',')
+    return options
+
+
+def main(args=None):
+    options = get_options(args)
+    backends = list(options.backends)
+    if 'libsumo' in backends and load_libsumo() is None:
+        print("libsumo is not installed, skipping its runs")
+        backends.remove('libsumo')
+    jobs = []
+    for scenario in options.scenarios:
+        seed = options.seed if options.seed is not None else scenario.seeds[0]
+        for variant in options.variants:
+            for backend in backends:
+                jobs.append((scenario, variant, backend, seed))
+
+    # one process per run, so every run starts cold and has its own peak RSS
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    results = []
+    references = {}
+    for result in pool.imap(run_benchmark, jobs):
+        results.append(result)
+        if 'error' in result:
+            print("{0:<36} failed\n{1}".format(run_key(result), result['error']))
+            continue
+        variant = SAME_TRIPS.get(result['variant'], result['variant'])
+        reference = references.setdefault((result['scenario'], variant), result['output'])
+        if reference == result['output']:
+            trips = ''
+        else:
+            trips = 'same trips' if same_trips(result['output'], reference) else 'TRIPS DIFFER'
+        print("{0:<36} {1:8d} steps {2:9.2f}s {3:10.1f} steps/s {4:6.1f} calls/step  {5}".format(
+            run_key(result), result['steps'], result['wall'], result['steps_per_s'],
+            result['calls_per_step'], trips))
+        sys.stdout.flush()
+    pool.close()
+    pool.join()
+
+    failed = sum(1 for result in results if 'error' in result)
+    if options.record:
+        with open(options.record, 'w') as output:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'runs': results},
+                      output, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            baseline = dict((run_key(run), run) for run in json.load(baseline_file)['runs']
+                            if 'error' not in run)
+        for result in results:
+            key = run_key(result)
+            if 'error' in result or key not in baseline:
+                continue
+            problems = compare(result, baseline[key], options.speed_tolerance,
+                               options.memory_tolerance, options.metric_tolerance)
+            if problems:
+                failed += 1
+                print("REGRESSION {0}: {1}".format(key, '; '.join(problems)))
+            else:
+                print("ok         {0}".format(key))
+    return 1 if failed else 0
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""Builds a scenario from its OpenStreetMap extract.
+
+    python -m sumosim.build manchester
+
+The stages are declared by the build.json of the scenario directory:
+
+    net      netconvert -c <netccfg> on the OSM file
+    poly     polyconvert -c <polycfg> on the OSM file and the net
+    demand   one sumosim.demand trip file per entry of 'demand', with its
+             min_distance and validate like randomTrips.py
+    sumocfg  the SUMO configuration using the net, trips and polygons
+
+Every stage is keyed by a digest of its input files and parameters. A stage
+whose key and outputs are unchanged since it last ran is skipped, so
+rebuilding a scenario where nothing upstream changed only hashes files.
+Stages whose inputs are ready run in parallel, the poly and demand stages
+all only wait for the net. The OSM type maps are taken from
+$SUMO_HOME/data/typemap when they are there.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import optparse
+import subprocess
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from sumosim import cache
+from sumosim import scenarios
+from sumosim import find_binary
+
+BUILD_FILE = 'build.json'
+# bump whenever the stage actions change to invalidate the recorded builds
+BUILD_VERSION = 2
+
+Stage = namedtuple('Stage', ['name', 'inputs', 'outputs', 'params', 'depends', 'action'])
+
+SUMOCFG = """<?xml version="1.0" encoding="UTF-8"?>
+
+<configuration xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:noNamespaceSchemaLocation="http://sumo.dlr.de/xsd/sumoConfiguration.xsd">
+
+    <input>
+        <net-file value="{net}"/>
+        <route-files value="{routes}"/>
+        <additional-files value="{additional}"/>
+    </input>
+
+    <processing>
+        <ignore-route-errors value="true"/>
+    </processing>
+
+    <routing>
+        <device.rerouting.adaptation-steps value="180"/>
+    </routing>
+
+    <report>
+        <verbose value="true"/>
+        <duration-log.statistics value="true"/>
+        <no-step-log value="true"/>
+    </report>
+
+    <gui_only>
+        <gui-settings-file value="osm.view.xml"/>
+    </gui_only>
+
+</configuration>
+"""
+
+
+def type_map(name):
+    """Returns the OSM type map of $SUMO_HOME, or None"""
+    if 'SUMO_HOME' in os.environ:
+        path = os.path.join(os.environ['SUMO_HOME'], 'data', 'typemap', name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def run_tool(name, args):
+    binary = find_binary(name)
+    if binary is None:
+        raise RuntimeError("{0} was not found, set SUMO_HOME or add it to the PATH".format(name))
+    subprocess.check_call([binary] + args)
+
+
+def netconvert(netccfg, osm, net):
+    args = ['-c', netccfg, '--osm-files', osm, '--output-file', net]
+    types = type_map('osmNetconvert.typ.xml')
+    if types is not None:
+        args += ['--type-files', types]
+    run_tool('netconvert', args)
+
+
+def polyconvert(polycfg, osm, net, poly):
+    args = ['-c', polycfg, '--osm-files', osm, '--net-file', net, '--output-file', poly]
+    types = type_map('osmPolyconvert.typ.xml')
+    if types is not None:
+        args += ['--type-file', types]
+    run_tool('polyconvert', args)
+
+
+def random_trips(net, output, vclass, period, end, fringe_factor=1., prefix='veh', seed=42,
+                 min_distance=0., validate=False):
+    # numpy and sumolib are only needed to build the demand
+    from sumosim import demand
+    from sumosim.network import read_net
+    edge_ids, weights, coordinates = demand.trip_edges(read_net(net), vclass, fringe_factor)
+    demand.write_trips(output, edge_ids, weights, end, period, vclass, prefix, seed,
+                       attributes={'departLane': 'best'}, coordinates=coordinates,
+                       min_distance=min_distance)
+    if validate:
+        demand.validate_trips(net, output)
+
+
+def write_sumocfg(path, net, routes, additional):
+    with open(path, 'w') as output:
+        output.write(SUMOCFG.format(net=net, routes=','.join(routes), additional=','.join(additional)))
+
+
+def osm_stages(directory, spec):
+    """Returns the stages of a build.json spec, paths relative to directory"""
+    def path(name):
+        return os.path.join(directory, name)
+    types = [types for types in (type_map('osmNetconvert.typ.xml'),) if types]
+    stages = [Stage('net', [path(spec['osm']), path(spec['netccfg'])] + types, [path(spec['net'])],
+                    {}, (), lambda: netconvert(path(spec['netccfg']), path(spec['osm']),
+                                               path(spec['net'])))]
+    if spec.get('poly'):
+        types = [types for types in (type_map('osmPolyconvert.typ.xml'),) if types]
+        stages.append(Stage(
+            'poly', [path(spec['osm']), path(spec['polycfg']), path(spec['net'])] + types,
+            [path(spec['poly'])], {}, ('net',),
+            lambda: polyconvert(path(spec['polycfg']), path(spec['osm']),
+                                path(spec['net']), path(spec['poly']))))
+    for entry in spec.get('demand', ()):
+        params = dict((key, value) for key, value in entry.items() if key != 'output')
+        stages.append(Stage(
+            'demand-' + entry['vclass'], [path(spec['net'])], [path(entry['output'])], params,
+            ('net',), lambda entry=entry, params=params: random_trips(
+                path(spec['net']), path(entry['output']), **params)))
+    routes = [entry['output'] for entry in spec.get('demand', ())]
+    additional = [spec['poly']] if spec.get('poly') else []
+    stages.append(Stage(
+        'sumocfg', [], [path(spec['sumocfg'])],
+        {'net': spec['net'], 'routes': routes, 'additional': additional}, (),
+        lambda: write_sumocfg(path(spec['sumocfg']), spec['net'], routes, additional)))
+    return stages
+
+
+def stage_key(stage):
+    return cache.digest(stage.inputs, stage.name, json.dumps(stage.params, sort_keys=True),
+                        BUILD_VERSION)
+
+
+def is_current(stage, record_path):
+    """Returns whether the recorded build of the stage is still in place"""
+    try:
+        with open(record_path) as record_file:
+            record = json.load(record_file)
+    except (IOError, OSError, ValueError):
+        return False
+    for output in stage.outputs:
+        if not os.path.exists(output) or record['outputs'].get(output) != cache.digest([output]):
+            return False
+    return True
+
+
+def run_stage(stage, build_name, force=False, cache_dir=None):
+    """Runs the stage unless it is current, returns (name, 'built' or
+    'cached', seconds)"""
+    start = time.time()
+    record_path = cache.entry_path('build', '{0}-{1}'.format(build_name, stage.name),
+                                   stage_key(stage), extension='.json', cache_dir=cache_dir)
+    if not force and is_current(stage, record_path):
+        return stage.name, 'cached', time.time() - start
+    stage.action()
+    handle, temp_path = cache.new_entry(record_path)
+    with os.fdopen(handle, 'w') as record_file:
+        json.dump({'outputs': dict((output, cache.digest([output])) for output in stage.outputs)},
+                  record_file, indent=2, sort_keys=True)
+    cache.commit_entry(temp_path, record_path)
+    return stage.name, 'built', time.time() - start
+
+
+def run_pipeline(stages, build_name, jobs=4, force=False, cache_dir=None):
+    """Runs the stages in waves, the stages whose dependencies are done in
+    parallel, and returns their results in completion order"""
+    done = set()
+    pending = list(stages)
+    results = []
+    pool = ThreadPool(jobs)
+    try:
+        while pending:
+            ready = [stage for stage in pending if done.issuperset(stage.depends)]
+            if not ready:
+                raise ValueError("stages {0} depend on missing stages".format(
+                    ', '.join(stage.name for stage in pending)))
+            for result in pool.imap_unordered(
+                    lambda stage: run_stage(stage, build_name, force, cache_dir), ready):
+                results.append(result)
+                done.add(result[0])
+                print("{0:<20} {1:<6} {2:8.2f}s".format(*result))
+                sys.stdout.flush()
+            pending = [stage for stage in pending if stage.name not in done]
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def get_options(args=None):
+    optParser = optparse.OptionParser(usage="%prog [options] <scenario>")
+    optParser.add_option("--jobs", type="int", default=4,
+                         help="stages run at the same time [default: %default]")
+    optParser.add_option("--force", action="store_true", default=False,
+                         help="run every stage, even if it is current")
+    options, args = optParser.parse_args(args)
+    if len(args) != 1:
+        optParser.error("expected one scenario")
+    options.scenario = args[0]
+    return options
+
+
+def main(args=None):
+    options = get_options(args)
+    directory = os.path.join(scenarios.ROOT, options.scenario)
+    try:
+        directory = scenarios.get_scenario(options.scenario).directory
+    except KeyError:
+        # a scenario being built for the first time has no scenario.json yet
+        pass
+    with open(os.path.join(directory, BUILD_FILE)) as build_file:
+        spec = json.load(build_file)
+    start = time.time()
+    run_pipeline(osm_stages(directory, spec), options.scenario, options.jobs, options.force)
+    print("built {0} in {1:.2f}s".format(options.scenario, time.time() - start))
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Content-hash keyed on-disk cache for data derived from scenario files.
+
+Entries are stored as <cache dir>/<kind>/<name>.<key><extension>, where the
+key is a digest of the input files, so an entry is never used once one of
+its inputs has changed. Older entries for the same name are removed when a
+new one is written.
+"""
+from __future__ import absolute_import
+
+import os
+import glob
+import pickle
+import hashlib
+import tempfile
+
+from sumosim.scenarios import ROOT
+
+CACHE_DIR = os.environ.get('SUMOSIM_CACHE', os.path.join(ROOT, '.cache'))
+
+
+def digest(paths, *extra):
+    """Returns a hex digest of the contents of the files and the extra values"""
+    sha = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as input_file:
+            for chunk in iter(lambda: input_file.read(1 << 20), b''):
+                sha.update(chunk)
+        sha.update(b'\0')
+    for value in extra:
+        sha.update(str(value).encode('utf-8'))
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def entry_path(kind, name, key, extension='.pickle', cache_dir=None):
+    """Returns the path of a cache entry"""
+    return os.path.join(cache_dir or CACHE_DIR, kind,
+                        '{0}.{1}{2}'.format(name.replace('.', '_'), key, extension))
+
+
+def remove_stale(path):
+    """Removes the other entries stored under the same kind and name"""
+    directory, filename = os.path.split(path)
+    name = filename.split('.', 1)[0]
+    for stale in glob.glob(os.path.join(directory, name + '.*')):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def load_pickle(path):
+    """Returns the object stored at path, or None if there is no usable entry"""
+    try:
+        with open(path, 'rb') as entry:
+            return pickle.load(entry)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+
+
+def new_entry(path):
+    """Returns a temporary file beside the entry path to write it to, as
+    (os handle, temporary path)"""
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return tempfile.mkstemp(dir=directory, suffix='.tmp')
+
+
+def commit_entry(temp_path, path):
+    """Moves a written temporary file in place, replacing older entries of
+    the same name"""
+    getattr(os, 'replace', os.rename)(temp_path, path)
+    remove_stale(path)
+
+
+def dump_pickle(obj, path):
+    """Stores the object at path, replacing older entries of the same name"""
+    handle, temp_path = new_entry(path)
+    with os.fdopen(handle, 'wb') as entry:
+        pickle.dump(obj, entry, pickle.HIGHEST_PROTOCOL)
+    commit_entry(temp_path, path)
@@ -0,0 +1,509 @@
+"""The priority lane ("cognitive radio") algorithm.
+
+Priority lanes are opened to standard vehicles while no priority vehicle
+uses them and closed again, with the standard vehicles moved off them, as
+soon as a bus, emergency vehicle or taxi is detected on the edge.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import traci.constants as tc
+
+from sumosim.backend import traci
+from sumosim.actuation import CommandQueue, submit
+from sumosim.network import NO_LANE, LaneIndex, PriorityLaneGraph, get_priority_lanes
+from sumosim.rerouting import RerouteScheduler
+from sumosim.vehicles import VehicleCache
+
+PRIORITY_ACCESS = frozenset(['passenger', 'private', 'evehicle'])
+
+
+class Controller(object):
+    """Base class of the controllers driven by sumosim.runner.simulate"""
+
+    def start(self):
+        """Called once the TraCI connection is up, before the first step"""
+
+    def step(self, step):
+        """Called before every simulation step, or every step it is
+        scheduled for, see sumosim.scheduling"""
+
+    def poll_vehicles(self):
+        """Returns the vehicle IDs on the edges and lanes the ChangeTracker
+        watches, read from TraCI, by number"""
+        edge_vehicles = dict((edge, traci.edge.getLastStepVehicleIDs(self.edge_ids[edge]))
+                             for edge in self.tracker.edges)
+        lane_ids = self.lane_index.lane_ids
+        lane_vehicles = dict((lane, traci.lane.getLastStepVehicleIDs(lane_ids[lane]))
+                             for lane in self.tracker.lanes)
+        return edge_vehicles, lane_vehicles
+
+    def idle(self):
+        """Returns whether the controller cannot act before a priority
+        vehicle departs"""
+        return False
+
+    def finish(self):
+        """Called after the last simulation step"""
+
+    def stats(self):
+        """Returns the cumulative counters of the actions taken so far"""
+        return {}
+
+
+class PriorityLaneController(Controller):
+    """Runs the cognitive radio steps on every edge whose vehicles changed.
+
+    Edges, lanes and vehicles are known by their numbers, see
+    sumosim.interning, and the SUMO IDs are only looked up to talk to SUMO.
+    The classes of the vehicles are read once per trip into a VehicleCache,
+    see sumosim.vehicles.
+
+    With 'subscriptions' the vehicles on the priority lanes and on the edges
+    with priority lanes are subscribed once and read from a per-step
+    snapshot. Otherwise they are polled from TraCI in every step. Either
+    way a ChangeTracker tells which edges changed, so edges without traffic
+    are never visited.
+
+    The vehicles of changed edges are rerouted through a RerouteScheduler
+    built with the 'reroute_*' arguments, see sumosim.rerouting.
+
+    With 'travel_time_model' (subscriptions only) the travel times are not
+    read back from SUMO per changed edge, a TravelTimeModel built with the
+    'travel_time_*' arguments pushes its estimates instead, see
+    sumosim.traveltime.
+
+    With 'corridor_hops' the priority lanes up to that many links ahead of a
+    lane closed for a priority vehicle are closed too, and held closed until
+    the lane is opened again.
+
+    The writes of a step are collected in a CommandQueue and sent together
+    at the end of the step, see sumosim.actuation.
+
+    When steps were simulated without it, see sumosim.scheduling, the
+    controller compares the vehicles in the network with the ones it knows
+    to find the vehicles that departed and arrived in those steps.
+
+    With 'decision_kernel' (subscriptions only) the edges to close and open
+    are picked in one vectorized pass over the priority lanes by a
+    DecisionKernel, see sumosim.kernel"""
+
+    def __init__(self, network, subscriptions=True, reroute_cooldown=0, reroute_budget=None,
+                 reroute_filter=False, travel_time_model=False, travel_time_alpha=0.5,
+                 travel_time_threshold=0.1, corridor_hops=0, decision_kernel=False):
+        if travel_time_model and not subscriptions:
+            raise ValueError("the travel time model needs subscriptions")
+        if decision_kernel and not subscriptions:
+            raise ValueError("the decision kernel needs subscriptions")
+        # need to work out priority lanes before simulation to ensure they don't
+        # get over-writen
+        self.lane_index = LaneIndex(network)
+        self.edge_ids = self.lane_index.edge_ids
+        self.commands = CommandQueue()
+        self.priority_access = PriorityAccess(self.lane_index, commands=self.commands)
+        self.lane_graph = PriorityLaneGraph(network, self.lane_index.lane_numbers)
+        self.corridor_hops = corridor_hops
+        self.subscriptions = subscriptions
+        self.snapshot = None
+        self.tracker = None
+        self.vehicles = VehicleCache()
+        self.rerouter = RerouteScheduler(reroute_cooldown, reroute_budget, reroute_filter,
+                                         self.vehicles.vehicle_ids, self.commands)
+        self.travel_times = None
+        if travel_time_model:
+            # numpy is only needed for the travel time model
+            from sumosim.traveltime import TravelTimeModel
+            self.travel_times = TravelTimeModel(network, travel_time_alpha, travel_time_threshold)
+        self.decision_kernel = decision_kernel
+        self.kernel = None
+        self.lane_changes = 0
+        self.step_number = None
+
+    def start(self):
+        self.tracker = ChangeTracker(self.lane_index, self.vehicles)
+        if self.subscriptions:
+            self.snapshot = StepSnapshot(
+                self.lane_index, self.tracker.lanes, self.tracker.edges,
+                range(len(self.edge_ids)) if self.travel_times is not None else ())
+        if self.decision_kernel:
+            # numpy is only needed for the decision kernel
+            from sumosim.kernel import DecisionKernel
+            self.kernel = DecisionKernel(self.lane_index, self.priority_access, self.vehicles,
+                                         recheck_open=bool(self.corridor_hops))
+
+    def step(self, step):
+        skipped = self.step_number is not None and step > self.step_number + 1
+        self.step_number = step
+        snapshot = self.snapshot
+        # arrived vehicles are only forgotten once the step is processed, so
+        # their numbers are not given to other vehicles before the rerouter
+        # dropped them
+        if snapshot is None:
+            if skipped:
+                departed, arrived = self.skipped_vehicles()
+            else:
+                departed = traci.simulation.getDepartedIDList()
+                arrived = traci.simulation.getArrivedIDList()
+            self.vehicles.depart(departed)
+            self.tracker.update(*self.poll_vehicles())
+            for edge in self.tracker.pop_dirty():
+                self.process_edge(edge, self.tracker.edge_vehicles[edge])
+            self.rerouter.flush(step, self.vehicles.arrive(arrived))
+            self.commands.flush()
+            return
+        snapshot.refresh()
+        if skipped:
+            snapshot.catch_up(*self.skipped_vehicles())
+        self.vehicles.depart(snapshot.departed)
+        self.tracker.update(snapshot.edge_vehicles, snapshot.lane_vehicles)
+        if self.kernel is not None:
+            self.kernel.move(self.tracker.moves)
+            self.apply_actions(self.kernel.decide(self.tracker.pop_dirty()), snapshot)
+        else:
+            for edge in self.tracker.pop_dirty():
+                self.process_edge(edge, self.tracker.edge_vehicles[edge], snapshot)
+        if self.travel_times is not None:
+            self.travel_times.observe(snapshot.edge_results)
+            self.travel_times.push(self.commands)
+        self.rerouter.flush(step, self.vehicles.arrive(snapshot.arrived))
+        self.commands.flush()
+
+    def process_edge(self, edge, edge_vehicles, snapshot=None):
+        """perform cognitive radio steps on an edge whose vehicles changed"""
+        #lanes
+        priority_lanes = self.lane_index.priority_lanes[edge]
+        if detect_priority_vehicle(priority_lanes, self.lane_index, self.vehicles, snapshot):
+            self.close_edge(edge, edge_vehicles, priority_lanes, snapshot)
+        elif get_priority_lanes(self.lane_index.edge_lanes[edge], self.lane_index) != []:
+            self.open_edge(edge, edge_vehicles)
+
+    def apply_actions(self, actions, snapshot):
+        """perform the cognitive radio steps decided by the kernel"""
+        for action in actions:
+            edge_vehicles = self.tracker.edge_vehicles[action.edge]
+            if action.close:
+                self.close_edge(action.edge, edge_vehicles, action.clean, snapshot)
+            elif not self.corridor_hops or get_priority_lanes(
+                    self.lane_index.edge_lanes[action.edge], self.lane_index) != []:
+                self.open_edge(action.edge, edge_vehicles)
+
+    def close_edge(self, edge, edge_vehicles, dirty_lanes, snapshot=None):
+        """Closes the priority lanes of an edge a priority vehicle drives on
+        and moves the standard vehicles off the 'dirty_lanes'"""
+        disable_priority_access(self.lane_index.priority_lanes[edge],
+                                self.priority_access, self.lane_graph, self.corridor_hops)
+        self.lane_changes += clean_priority_lanes(
+            dirty_lanes, self.lane_index, self.vehicles, snapshot, self.commands)
+        edge_id = self.edge_ids[edge]
+        if self.travel_times is None:
+            update_edge_travel_time(edge_id, self.commands)
+        self.rerouter.request(edge_id, edge_vehicles, self.step_number)
+
+    def open_edge(self, edge, edge_vehicles):
+        """Opens the priority lanes of an edge without priority vehicles"""
+        for lane in enable_priority_access(self.lane_index.priority_lanes[edge],
+                                           self.priority_access):
+            self.revisit(self.lane_index.lane_edge[lane])
+        edge_id = self.edge_ids[edge]
+        if self.travel_times is None:
+            update_edge_travel_time(edge_id, self.commands)
+        self.rerouter.request(edge_id, edge_vehicles, self.step_number)
+
+    def poll_vehicles(self):
+        """Returns the vehicle IDs on the edges and lanes the ChangeTracker
+        watches, read from TraCI, by number"""
+        edge_vehicles = dict((edge, traci.edge.getLastStepVehicleIDs(self.edge_ids[edge]))
+                             for edge in self.tracker.edges)
+        lane_ids = self.lane_index.lane_ids
+        lane_vehicles = dict((lane, traci.lane.getLastStepVehicleIDs(lane_ids[lane]))
+                             for lane in self.tracker.lanes)
+        return edge_vehicles, lane_vehicles
+
+    def idle(self):
+        """Returns whether no priority vehicle is in the network and no
+        reroutes wait, so nothing is closed, cleaned or rerouted before the
+        next priority vehicle departs"""
+        return not self.rerouter.pending and self.vehicles.priority_count() == 0
+
+    def skipped_vehicles(self):
+        """Returns the vehicles that departed and arrived in the steps
+        simulated without the controller"""
+        present = traci.vehicle.getIDList()
+        known = self.vehicles.numbers
+        departed = [vehicle for vehicle in present if vehicle not in known]
+        present = set(present)
+        arrived = [vehicle for vehicle in known.numbers if vehicle not in present]
+        return departed, arrived
+
+    def revisit(self, edge):
+        """Makes the controller process the edge in the next step although
+        its vehicles did not change, used once a held lane is released"""
+        self.tracker.dirty.add(edge)
+
+    def stats(self):
+        stats = {
+            'transitions': self.priority_access.transitions,
+            'skipped_writes': self.priority_access.skipped,
+            'corridor_holds': self.priority_access.holds_placed,
+            'lane_changes': self.lane_changes,
+        }
+        stats.update(self.rerouter.stats())
+        stats.update(self.commands.stats())
+        stats.update(self.vehicles.stats())
+        if self.travel_times is not None:
+            stats.update(self.travel_times.stats())
+        if self.kernel is not None:
+            stats.update(self.kernel.stats())
+        return stats
+
+
+class PriorityAccess(object):
+    """Open/closed state of every priority lane as last applied to SUMO.
+
+    setAllowed is only sent when a lane really changes state; 'transitions'
+    counts the writes that were sent and 'skipped' the ones that were not.
+
+    A lane closed ahead of a priority vehicle is held closed by the lane the
+    vehicle was detected on and is not opened until all its holds are
+    released. The states are kept by lane number in a bytearray.
+
+    Given a CommandQueue the writes are queued on it instead of sent"""
+
+    OPEN = 0
+    CLOSED = 1
+
+    def __init__(self, lane_index, access=PRIORITY_ACCESS, commands=None):
+        self.lane_index = lane_index
+        self.access = frozenset(access)
+        self.commands = commands
+        self.states = bytearray(len(lane_index.lane_ids))
+        # held lane -> lanes holding it, and the other way round
+        self.holds = {}
+        self.held_by = {}
+        self.transitions = 0
+        self.skipped = 0
+        self.holds_placed = 0
+        # called with (lane, closed) whenever a lane changes state
+        self.on_change = None
+        for lane in lane_index.all_priority_lanes():
+            if self.access <= lane_index.allowed[lane]:
+                self.states[lane] = self.OPEN
+            else:
+                self.states[lane] = self.CLOSED
+
+    def open(self, lane):
+        """Lets the priority access classes drive on the lane, unless it is held"""
+        if lane in self.holds:
+            self.skipped += 1
+            return
+        self._apply(lane, self.OPEN, self.lane_index.allowed[lane] | self.access)
+
+    def close(self, lane):
+        """Restricts the lane to the classes it allowed before being opened"""
+        self._apply(lane, self.CLOSED, self.lane_index.allowed[lane] - self.access)
+
+    def hold(self, lane, source):
+        """Closes the lane and keeps it closed until 'source' releases it"""
+        holders = self.holds.setdefault(lane, set())
+        if source not in holders:
+            holders.add(source)
+            self.held_by.setdefault(source, set()).add(lane)
+            self.holds_placed += 1
+        self.close(lane)
+
+    def release(self, source):
+        """Drops the holds of 'source', returns the lanes no longer held"""
+        released = []
+        for lane in self.held_by.pop(source, ()):
+            holders = self.holds[lane]
+            holders.discard(source)
+            if not holders:
+                del self.holds[lane]
+                released.append(lane)
+        return released
+
+    def _apply(self, lane, state, allowed):
+        if self.states[lane] == state:
+            self.skipped += 1
+            return
+        lane_id = self.lane_index.lane_ids[lane]
+        submit(self.commands, 'setAllowed', lane_id, traci.lane.setAllowed, lane_id, list(allowed))
+        self.lane_index.update_allowed(lane, allowed)
+        self.states[lane] = state
+        self.transitions += 1
+        if self.on_change is not None:
+            self.on_change(lane, state == self.CLOSED)
+
+
+class StepSnapshot(object):
+    """Subscribes to the variables read by the algorithm and exposes the
+    values delivered with the last simulation step: the vehicles on the
+    given 'lanes' and 'edges' and the mean speed and occupancy of the
+    'measured' edges, all by number. Only lanes and edges are subscribed,
+    not vehicles, so a step costs as much as the lanes and edges watched
+    and not as much as the vehicles in the network.
+
+    'lane_vehicles' and 'edge_vehicles' are indexed by the number of the
+    lane and edge, the ones not subscribed stay empty. 'edge_results' holds
+    the results of the edges by ID"""
+
+    def __init__(self, lane_index, lanes, edges=(), measured=()):
+        self.lane_numbers = lane_index.lane_numbers.numbers
+        self.edge_numbers = lane_index.edge_numbers.numbers
+        self.lane_vehicles = [()] * len(lane_index.lane_ids)
+        self.edge_vehicles = [()] * len(lane_index.edge_ids)
+        self.edge_results = {}
+        self.departed = ()
+        self.arrived = ()
+        for lane in lanes:
+            traci.lane.subscribe(lane_index.lane_ids[lane], [tc.LAST_STEP_VEHICLE_ID_LIST])
+        # a second subscription of an edge would replace the first one
+        variables = dict((edge, [tc.LAST_STEP_VEHICLE_ID_LIST]) for edge in edges)
+        for edge in measured:
+            variables.setdefault(edge, []).extend([tc.LAST_STEP_MEAN_SPEED, tc.LAST_STEP_OCCUPANCY])
+        for edge in sorted(variables):
+            traci.edge.subscribe(lane_index.edge_ids[edge], variables[edge])
+        traci.simulation.subscribe([tc.VAR_DEPARTED_VEHICLES_IDS, tc.VAR_ARRIVED_VEHICLES_IDS])
+
+    def catch_up(self, departed, arrived):
+        """Replaces the departed and arrived vehicles of the last step by
+        those of all steps since the previous refresh"""
+        self.departed = departed
+        self.arrived = arrived
+
+    def refresh(self):
+        """Reads the subscription results of the last simulation step"""
+        simulation = traci.simulation.getSubscriptionResults()
+        self.departed = simulation.get(tc.VAR_DEPARTED_VEHICLES_IDS, ())
+        self.arrived = simulation.get(tc.VAR_ARRIVED_VEHICLES_IDS, ())
+        lane_vehicles = self.lane_vehicles
+        lane_numbers = self.lane_numbers
+        for lane, result in traci.lane.getAllSubscriptionResults().items():
+            lane_vehicles[lane_numbers[lane]] = result[tc.LAST_STEP_VEHICLE_ID_LIST]
+        edge_vehicles = self.edge_vehicles
+        edge_numbers = self.edge_numbers
+        self.edge_results = traci.edge.getAllSubscriptionResults()
+        for edge, result in self.edge_results.items():
+            vehicles = result.get(tc.LAST_STEP_VEHICLE_ID_LIST)
+            if vehicles is not None:
+                edge_vehicles[edge_numbers[edge]] = vehicles
+
+
+class ChangeTracker(object):
+    """Finds the edges whose vehicles changed in the last step.
+
+    Only the edges with priority lanes are tracked, the algorithm never
+    acts on the others. An edge is dirty when the set of vehicles on it
+    changed or a vehicle moved onto or off one of its priority lanes, as a
+    bus changing into the bus lane of its edge. Every tracked edge is
+    dirty in the first step, like the first comparison of the polling path.
+    Dirty edges are returned in network order so the actions are sent in
+    the same order as a full scan would send them.
+
+    The vehicles entering and leaving the priority lanes are recorded in
+    'moves' for the DecisionKernel. Edges, lanes and vehicles are numbers,
+    the vehicles numbered by the VehicleCache; 'edge_vehicles' holds the
+    vehicles of every tracked edge in the order SUMO reports them"""
+
+    def __init__(self, lane_index, vehicles):
+        self.lane_edge = lane_index.lane_edge
+        self.vehicles = vehicles
+        self.edges = lane_index.priority_edges()
+        self.lanes = lane_index.all_priority_lanes()
+        # the vehicle IDs last reported on every edge and priority lane
+        self.edge_ids = [()] * len(lane_index.edge_ids)
+        self.lane_ids = [()] * len(lane_index.lane_ids)
+        self.edge_vehicles = [[] for _ in lane_index.edge_ids]
+        self.dirty = set(self.edges)
+        # (vehicle, old lane, new lane) of the last update, NO_LANE off the
+        # priority lanes
+        self.moves = []
+
+    def update(self, edge_vehicles, lane_vehicles):
+        """Takes the vehicle IDs on the edges and lanes, indexed by number"""
+        moves = self.moves = []
+        number = self.vehicles.number
+        for edge in self.edges:
+            vehicle_ids = edge_vehicles[edge]
+            old_ids = self.edge_ids[edge]
+            if vehicle_ids != old_ids:
+                self.edge_ids[edge] = vehicle_ids
+                if frozenset(vehicle_ids) != frozenset(old_ids):
+                    self.edge_vehicles[edge] = [number(vehicle) for vehicle in vehicle_ids]
+                    self.dirty.add(edge)
+        for lane in self.lanes:
+            vehicle_ids = lane_vehicles[lane]
+            old_ids = self.lane_ids[lane]
+            if vehicle_ids != old_ids:
+                self.lane_ids[lane] = vehicle_ids
+                vehicle_set = frozenset(vehicle_ids)
+                old_set = frozenset(old_ids)
+                if vehicle_set != old_set:
+                    self.dirty.add(self.lane_edge[lane])
+                for vehicle in old_set - vehicle_set:
+                    moves.append((number(vehicle), lane, NO_LANE))
+                for vehicle in vehicle_set - old_set:
+                    moves.append((number(vehicle), NO_LANE, lane))
+
+    def pop_dirty(self):
+        """Returns the dirty edges in network order and clears them"""
+        dirty = sorted(self.dirty)
+        self.dirty = set()
+        return dirty
+
+
+def get_lane_vehicles(lane, lane_index, snapshot=None):
+    """Returns the IDs of the vehicles on the lane from the snapshot or from TraCI"""
+    if snapshot is not None:
+        return snapshot.lane_vehicles[lane]
+    return traci.lane.getLastStepVehicleIDs(lane_index.lane_ids[lane])
+
+def detect_priority_vehicle(priority_lanes, lane_index, vehicles, snapshot=None):
+    """Returns whether a priority vehicle drives on any of the priority lanes"""
+    for lane in priority_lanes:
+        for vehicle in get_lane_vehicles(lane, lane_index, snapshot):
+            if vehicles.is_priority(vehicle):
+                return True
+    return False
+
+def enable_priority_access(priority_lanes, priority_access):
+    """Enables standard vehicles defined in 'priority access' to drive in priority lanes,
+    returns the lanes ahead that are no longer held closed by them"""
+    released = []
+    for lane in priority_lanes:
+        released.extend(priority_access.release(lane))
+        priority_access.open(lane)
+    return released
+
+def disable_priority_access(priority_lanes, priority_access, lane_graph=None, hops=0):
+    """Stops non-priority vehicles driving on priority lanes, 
+    turns off successive priority lanes, up to 'hops' links ahead in the precomputed
+    lane graph, in order to avoid congestion for the priority vehicle"""
+    for lane in priority_lanes:
+        priority_access.close(lane)
+        if hops:
+            for ahead in lane_graph.corridor(lane, hops):
+                priority_access.hold(ahead, lane)
+
+def clean_priority_lanes(priority_lanes, lane_index, vehicles, snapshot=None, commands=None):
+    """Removes non-prioirty vehicles from the provided list of priority lanes,
+    returns the number of vehicles told to change lane. The lane changes are
+    queued on 'commands' if given"""
+    changes = 0
+    for lane in priority_lanes:
+        lane_id = lane_index.indices[lane]
+        for vehicle in get_lane_vehicles(lane, lane_index, snapshot):
+            if not vehicles.is_priority(vehicle):
+                submit(commands, 'changeLane', vehicle, traci.vehicle.changeLane, vehicle, lane_id+1, 0)
+                changes += 1
+    return changes
+
+def update_edge_travel_time(edge, commands=None):
+    """Updates the travel time on given edge, queued on 'commands' if given"""
+    submit(commands, 'adaptTraveltime', edge, traci.edge.adaptTraveltime,
+           edge, traci.edge.getTraveltime(edge))
+
+def simulate_congestion(lanes, speed):
+    """Reduces speed for all given lanes to simulate congestion"""
+    for lane in lanes:
+        traci.lane.setMaxSpeed(lane, speed)
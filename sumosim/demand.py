@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+"""Vectorized, seeded demand generation.
+
+Departures of all flows are sampled at once with NumPy, one block of steps
+at a time, and the vehicles are streamed to the route file in large
+buffered chunks, so even stress scenarios of hundreds of thousands of
+vehicles are written in seconds.
+
+    python -m sumosim.demand flows test-edge/demand.json -o test-edge/single-edge-generated.rou.xml
+    python -m sumosim.demand trips manchester/osm.net.xml --vclass bus --period 2.391507 \\
+        --end 1000 --fringe-factor 5 --prefix bus --min-distance 600 --validate \\
+        -o manchester/osm.bus.trips.xml
+
+'flows' reads a JSON demand spec of vTypes, routes and flows:
+
+    {"vtypes": {"car": {"vClass": "private", "maxSpeed": "30.00"}},
+     "routes": {"WE": "anti-clock-1 anti-clock-2"},
+     "flows": [{"route": "WE", "type": "car", "probability": 0.1, "lanes": [1, 2]},
+               {"route": "WE", "type": "bus", "probability": 0.1, "lanes": [0], "every": 2}]}
+
+where a flow departs with 'probability' in every 'every'th step (Bernoulli)
+or, with --poisson, a Poisson number of vehicles with that mean, on a lane
+drawn uniformly from 'lanes'. 'trips' replaces randomTrips.py: origins and
+destinations are drawn from the edges allowing the vClass, fringe edges
+weighted by the fringe factor, one trip every 'period' seconds. A trip's
+destination is drawn again while it is closer than --min-distance to its
+origin, and --validate routes the trips and drops the unroutable ones.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import os
+import json
+import optparse
+import tempfile
+from collections import namedtuple
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+Flow = namedtuple('Flow', ['route', 'vtype', 'probability', 'lanes', 'every'])
+
+# steps sampled at once, bounds the memory of the random draws
+BLOCK_STEPS = 3600
+# vehicles formatted and written at once
+CHUNK = 1 << 16
+BUFFER = 1 << 20
+# draws of a trip's destination before the trip is dropped
+MAX_TRIES = 100
+
+
+def load_spec(path):
+    """Returns (vtypes, routes, flows) of a JSON demand spec"""
+    with open(path) as spec_file:
+        spec = json.load(spec_file)
+    flows = [Flow(flow['route'], flow['type'], float(flow['probability']),
+                  tuple(flow.get('lanes', (0,))), int(flow.get('every', 1)))
+             for flow in spec['flows']]
+    return spec.get('vtypes', {}), spec.get('routes', {}), flows
+
+
+def sample_departures(flows, steps, rng, poisson=False, scale=1.):
+    """Yields blocks of (depart step, flow index, depart lane) arrays, ordered
+    by step and by flow within a step, as SUMO wants the vehicles sorted"""
+    probability = np.array([flow.probability for flow in flows], dtype=np.float64) * scale
+    every = np.array([flow.every for flow in flows], dtype=np.int64)
+    # the lanes of every flow, padded to the longest list
+    lane_counts = np.array([len(flow.lanes) for flow in flows], dtype=np.int64)
+    lanes = np.zeros((len(flows), lane_counts.max() if flows else 0), dtype=np.int64)
+    for index, flow in enumerate(flows):
+        lanes[index, :len(flow.lanes)] = flow.lanes
+    for begin in range(0, steps, BLOCK_STEPS):
+        step = np.arange(begin, min(begin + BLOCK_STEPS, steps))
+        active = step[:, None] % every[None, :] == 0
+        if poisson:
+            counts = rng.poisson(probability, (len(step), len(flows))) * active
+        else:
+            counts = (rng.random((len(step), len(flows))) < probability) & active
+        block_step, flow = np.nonzero(counts)
+        if poisson:
+            repeats = counts[block_step, flow]
+            block_step = np.repeat(block_step, repeats)
+            flow = np.repeat(flow, repeats)
+        lane = lanes[flow, rng.integers(0, lane_counts[flow])]
+        yield step[block_step], flow, lane
+
+
+def format_attributes(attributes):
+    return ' '.join('{0}="{1}"'.format(key, value) for key, value in sorted(attributes.items()))
+
+
+def write_flows(path, vtypes, routes, flows, steps, seed=42, poisson=False, scale=1.):
+    """Writes the sampled vehicles of the flows to a route file, returns the
+    number of vehicles"""
+    rng = np.random.default_rng(seed)
+    route_ids = [flow.route for flow in flows]
+    type_ids = [flow.vtype for flow in flows]
+    count = 0
+    with io.open(path, 'w', buffering=BUFFER) as output:
+        output.write(u'<routes>\n')
+        for vtype in sorted(vtypes):
+            output.write(u'    <vType id="{0}" {1}/>\n'.format(vtype, format_attributes(vtypes[vtype])))
+        for route in sorted(routes):
+            output.write(u'    <route id="{0}" edges="{1}"/>\n'.format(route, routes[route]))
+        for depart, flow, lane in sample_departures(flows, steps, rng, poisson, scale):
+            for start in range(0, len(depart), CHUNK):
+                lines = []
+                for vehicle_depart, vehicle_flow, vehicle_lane in zip(
+                        depart[start:start + CHUNK].tolist(), flow[start:start + CHUNK].tolist(),
+                        lane[start:start + CHUNK].tolist()):
+                    lines.append(u'    <vehicle id="{0}_{1}" type="{2}" route="{0}" depart="{3}" '
+                                 u'departLane="{4}"/>\n'.format(
+                                     route_ids[vehicle_flow], count, type_ids[vehicle_flow],
+                                     vehicle_depart, vehicle_lane))
+                    count += 1
+                output.write(u''.join(lines))
+        output.write(u'</routes>\n')
+    return count
+
+
+def trip_edges(net, vclass, fringe_factor=1.):
+    """Returns the edges allowing the vClass, their sampling weights and the
+    (start, end) coordinates of their from and to nodes"""
+    edges = [edge for edge in net.getEdges() if edge.allows(vclass)]
+    weights = np.array([fringe_factor if edge.is_fringe() else 1. for edge in edges])
+    starts = np.array([edge.getFromNode().getCoord()[:2] for edge in edges],
+                      dtype=np.float64).reshape(-1, 2)
+    ends = np.array([edge.getToNode().getCoord()[:2] for edge in edges],
+                    dtype=np.float64).reshape(-1, 2)
+    return [edge.getID() for edge in edges], weights / weights.sum(), (starts, ends)
+
+
+def too_close(origin, destination, coordinates=None, min_distance=0.):
+    """Returns which trips end on the edge they start on or, with the edge
+    coordinates, less than 'min_distance' from their start in a straight
+    line, from the origin's from node to the destination's to node like
+    randomTrips.py measures it"""
+    close = origin == destination
+    if coordinates is not None and min_distance > 0:
+        starts, ends = coordinates
+        offset = ends[destination] - starts[origin]
+        close |= np.hypot(offset[:, 0], offset[:, 1]) < min_distance
+    return close
+
+
+def draw_trips(edge_ids, weights, end, period, seed=42, begin=0., coordinates=None,
+               min_distance=0.):
+    """Returns the departure times, origins and destinations of one random
+    trip every 'period' seconds from 'begin' to 'end'. Destinations that are
+    too_close are drawn again, trips still without one after MAX_TRIES
+    draws are dropped"""
+    rng = np.random.default_rng(seed)
+    depart = np.arange(begin, end, period)
+    origin = rng.choice(len(edge_ids), len(depart), p=weights)
+    destination = rng.choice(len(edge_ids), len(depart), p=weights)
+    redraw = np.flatnonzero(too_close(origin, destination, coordinates, min_distance))
+    for _ in range(MAX_TRIES):
+        if not len(redraw):
+            break
+        destination[redraw] = rng.choice(len(edge_ids), len(redraw), p=weights)
+        redraw = redraw[too_close(origin[redraw], destination[redraw], coordinates, min_distance)]
+    keep = np.ones(len(depart), dtype=bool)
+    keep[redraw] = False
+    return depart[keep], origin[keep], destination[keep]
+
+
+def write_trips(path, edge_ids, weights, end, period, vclass, prefix='veh', seed=42,
+                begin=0., attributes=None, coordinates=None, min_distance=0.):
+    """Writes the draw_trips trips to a trip file, returns the number of trips"""
+    depart, origin, destination = draw_trips(edge_ids, weights, end, period, seed, begin,
+                                             coordinates, min_distance)
+    extra = format_attributes(attributes or {})
+    with io.open(path, 'w', buffering=BUFFER) as output:
+        output.write(u'<trips>\n    <vType id="{0}" vClass="{0}"/>\n'.format(vclass))
+        for start in range(0, len(depart), CHUNK):
+            output.write(u''.join(
+                u'    <trip id="{0}{1}" depart="{2:.2f}" from="{3}" to="{4}" type="{5}" {6}/>\n'.format(
+                    prefix, start + offset, trip_depart, edge_ids[trip_origin],
+                    edge_ids[trip_destination], vclass, extra)
+                for offset, (trip_depart, trip_origin, trip_destination) in enumerate(zip(
+                    depart[start:start + CHUNK].tolist(), origin[start:start + CHUNK].tolist(),
+                    destination[start:start + CHUNK].tolist()))))
+        output.write(u'</trips>\n')
+    return len(depart)
+
+
+def validate_trips(netfile, path, router='auto'):
+    """Routes the trips of the trip file and rewrites it with only the
+    routable ones, like randomTrips.py --validate. Returns the number of
+    trips kept"""
+    # the routers are only needed to validate the trips
+    from sumosim import routing
+    handle, routes = tempfile.mkstemp(suffix='.rou.xml')
+    os.close(handle)
+    try:
+        routing.route_trips(routing.find_router(router), netfile, [path], routes)
+        routed = set()
+        for _, element in ElementTree.iterparse(routes):
+            if element.tag == 'vehicle':
+                routed.add(element.get('id'))
+                element.clear()
+    finally:
+        os.remove(routes)
+    tree = ElementTree.parse(path)
+    root = tree.getroot()
+    for trip in root.findall('trip'):
+        if trip.get('id') not in routed:
+            root.remove(trip)
+    tree.write(path)
+    return len(root.findall('trip'))
+
+
+def get_options(args=None):
+    optParser = optparse.OptionParser(
+        usage="%prog [options] flows <spec.json> | trips <net.xml>")
+    optParser.add_option("-o", "--output", help="route or trip file to write")
+    optParser.add_option("--seed", type="int", default=42, help="random seed [default: %default]")
+    optParser.add_option("--steps", type="int", default=3600,
+                         help="flows: steps to generate departures for [default: %default]")
+    optParser.add_option("--poisson", action="store_true", default=False,
+                         help="flows: Poisson numbers of departures instead of Bernoulli")
+    optParser.add_option("--scale", type="float", default=1.,
+                         help="flows: factor on every probability, for stress demand [default: %default]")
+    optParser.add_option("--vclass", default="passenger", help="trips: vehicle class [default: %default]")
+    optParser.add_option("--period", type="float", default=1.,
+                         help="trips: seconds between trips [default: %default]")
+    optParser.add_option("--begin", type="float", default=0., help="trips: first departure [default: %default]")
+    optParser.add_option("--end", type="float", default=3600., help="trips: end of departures [default: %default]")
+    optParser.add_option("--fringe-factor", type="float", default=1.,
+                         help="trips: weight of fringe edges [default: %default]")
+    optParser.add_option("--prefix", default="veh", help="trips: trip id prefix [default: %default]")
+    optParser.add_option("--depart-lane", default="best",
+                         help="trips: departLane of the trips [default: %default]")
+    optParser.add_option("--min-distance", type="float", default=0.,
+                         help="trips: straight line distance between the start and the end of "
+                              "a trip [default: %default]")
+    optParser.add_option("--validate", action="store_true", default=False,
+                         help="trips: drop the trips that cannot be routed")
+    options, args = optParser.parse_args(args)
+    if len(args) != 2 or args[0] not in ('flows', 'trips'):
+        optParser.error("expected 'flows <spec.json>' or 'trips <net.xml>'")
+    if not options.output:
+        optParser.error("--output is required")
+    options.command, options.input = args
+    return options
+
+
+def main(args=None):
+    options = get_options(args)
+    if options.command == 'flows':
+        vtypes, routes, flows = load_spec(options.input)
+        count = write_flows(options.output, vtypes, routes, flows, options.steps, options.seed,
+                            options.poisson, options.scale)
+    else:
+        # sumolib is only needed to pick the trip edges
+        from sumosim.network import read_net
+        edge_ids, weights, coordinates = trip_edges(read_net(options.input), options.vclass,
+                                                    options.fringe_factor)
+        count = write_trips(options.output, edge_ids, weights, options.end, options.period,
+                            options.vclass, options.prefix, options.seed, options.begin,
+                            {'departLane': options.depart_lane}, coordinates,
+                            options.min_distance)
+        if options.validate:
+            count = validate_trips(options.input, options.output)
+    print("{0}: {1} vehicles".format(options.output, count))
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""Runs the seed x algorithm x scenario matrix across a pool of worker
+processes.
+
+    python -m sumosim.experiments --scenarios grid-4,grid-10 --jobs 8
+
+Every job starts its own SUMO instance on its own TraCI port and label and
+writes the scenario's usual tripinfo output. The console output of each job
+goes to a log file beside its tripinfo output.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import sys
+import time
+import optparse
+import traceback
+import multiprocessing
+
+from sumosim import scenarios
+from sumosim import runner
+from sumosim.backend import BACKENDS
+
+VARIANTS = ('algorithm', 'no-algorithm')
+
+
+def build_jobs(selected, variants, seeds, base_port, subscriptions=True, store=False,
+               backend='traci', warmup=0):
+    """Returns one job per scenario, variant and seed, each with its own port.
+    Without 'seeds' every scenario runs its own seeds"""
+    jobs = []
+    for scenario in selected:
+        for variant in variants:
+            algorithm = variant == 'algorithm'
+            for seed in seeds or scenario.seeds:
+                output_file = scenario.output_file(algorithm, seed)
+                jobs.append({
+                    'label': '{0}-{1}-{2}'.format(scenario.name, variant, seed),
+                    'scenario': scenario,
+                    'output': output_file,
+                    'log': os.path.splitext(output_file)[0] + '.log',
+                    'seed': seed,
+                    'algorithm': algorithm,
+                    'subscriptions': subscriptions,
+                    'store': store,
+                    'backend': backend,
+                    'warmup': warmup,
+                    'port': base_port + len(jobs),
+                })
+    return jobs
+
+
+def run_job(job):
+    """Runs a single simulation in this worker, returns (label, seconds, error)"""
+    start = time.time()
+    stdout = sys.stdout
+    try:
+        with open(job['log'], 'w') as log:
+            sys.stdout = log
+            store = None
+            if job['store']:
+                from sumosim.store import ResultStore
+                store = ResultStore()
+            runner.run(job['scenario'], job['seed'], job['algorithm'], job['subscriptions'],
+                       output_file=job['output'], port=job['port'], label=job['label'],
+                       store=store, backend=job['backend'], warmup=job['warmup'])
+    except (Exception, SystemExit):
+        return job['label'], time.time() - start, traceback.format_exc()
+    finally:
+        sys.stdout = stdout
+    return job['label'], time.time() - start, None
+
+
+def run_warmup(job):
+    """Builds the warm-up snapshot of a job's scenario and seed, returns
+    (label, seconds, error)"""
+    start = time.time()
+    try:
+        runner.prepare_warmup(job['scenario'], job['seed'], job['warmup'], backend=job['backend'],
+                              port=job['port'], label=job['label'])
+    except (Exception, SystemExit):
+        return job['label'], time.time() - start, traceback.format_exc()
+    return job['label'], time.time() - start, None
+
+
+def get_options(args=None):
+    known = scenarios.load_scenarios()
+    optParser = optparse.OptionParser()
+    optParser.add_option("--scenarios", default=','.join(sorted(known)),
+                         help="comma separated scenarios to run [default: %default]")
+    optParser.add_option("--variants", default=','.join(VARIANTS),
+                         help="comma separated variants to run [default: %default]")
+    optParser.add_option("--seeds",
+                         help="comma separated seeds to run [default: each scenario's seeds]")
+    optParser.add_option("--jobs", type="int", default=multiprocessing.cpu_count(),
+                         help="number of worker processes [default: %default]")
+    optParser.add_option("--port", type="int", default=8813,
+                         help="TraCI port of the first job, later jobs count up [default: %default]")
+    optParser.add_option("--polling", action="store_true",
+                         default=False, help="query TraCI per edge/lane instead of using subscriptions")
+    optParser.add_option("--backend", type="choice", choices=BACKENDS, default="traci",
+                         help="SUMO binding of the jobs, see sumosim.backend [default: %default]")
+    optParser.add_option("--warmup", type="float", default=0,
+                         help="seconds simulated once per scenario and seed, both variants "
+                              "start from the saved state [default: %default]")
+    optParser.add_option("--store", action="store_true",
+                         default=False, help="also write the trips of each run to the columnar result store")
+    options, args = optParser.parse_args(args)
+    for name in options.scenarios.split(','):
+        if name not in known:
+            optParser.error("unknown scenario '{0}'".format(name))
+    for variant in options.variants.split(','):
+        if variant not in VARIANTS:
+            optParser.error("unknown variant '{0}'".format(variant))
+    options.scenarios = [known[name] for name in options.scenarios.split(',')]
+    options.variants = options.variants.split(',')
+    if options.seeds is not None:
+        options.seeds = [int(seed) for seed in options.seeds.split(',')]
+    return options
+
+
+def main(args=None):
+    options = get_options(args)
+    jobs = build_jobs(options.scenarios, options.variants, options.seeds,
+                      options.port, not options.polling, options.store, options.backend,
+                      options.warmup)
+
+    start = time.time()
+    failed = 0
+    pool = multiprocessing.Pool(min(options.jobs, len(jobs)))
+    if options.warmup:
+        # one snapshot per scenario and seed, before the variants fork from it
+        warmups = dict(((job['scenario'].name, job['seed']), job) for job in jobs)
+        for label, seconds, error in pool.imap_unordered(run_warmup, list(warmups.values())):
+            if error is not None:
+                print("warm-up of {0} failed after {1:.1f}s\n{2}".format(label, seconds, error))
+            sys.stdout.flush()
+    for label, seconds, error in pool.imap_unordered(run_job, jobs):
+        if error is None:
+            print("{0} finished in {1:.1f}s".format(label, seconds))
+        else:
+            failed += 1
+            print("{0} failed after {1:.1f}s\n{2}".format(label, seconds, error))
+        sys.stdout.flush()
+    pool.close()
+    pool.join()
+    print("{0} of {1} runs finished in {2:.1f}s".format(
+        len(jobs) - failed, len(jobs), time.time() - start))
+    return 1 if failed else 0
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""Per-step timing of the control loop and TraCI call counts.
+
+Every step is split into four phases:
+
+    simulate  time spent in traci.simulationStep, i.e. inside SUMO
+    query     TraCI calls reading state (get*, subscribe*)
+    actuate   TraCI calls changing state (setAllowed, changeLane, ...)
+    decide    the remaining time of the controller step, i.e. Python
+
+The TraCI domains are wrapped while the instrumentation is installed, so the
+controllers need no changes to be measured. Only the outermost call is timed
+and counted when a TraCI method calls others, like rerouteTraveltime calling
+getRoutingMode and setRoutingMode.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import csv
+import json
+import time
+import cProfile
+from collections import Counter
+
+from sumosim.backend import traci
+from sumosim.controller import Controller
+from sumosim.stats import percentile
+
+PHASES = ('simulate', 'query', 'decide', 'actuate')
+DOMAINS = ('edge', 'lane', 'vehicle', 'simulation', 'route', 'vehicletype')
+QUERY_PREFIXES = ('get', 'subscribe', 'unsubscribe')
+PERCENTILES = (50, 90, 99)
+
+
+class Instrumentation(object):
+    """Collects the phase timings of every step and the TraCI calls by command"""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.timeline = []
+        self.elapsed = dict.fromkeys(PHASES, 0.)
+        self.step_calls = 0
+        # wrapped calls in progress, the calls a wrapped method makes to
+        # other wrapped methods are part of the outermost call
+        self._depth = 0
+        self._wrapped = []
+        self._started = None
+
+    def install(self):
+        """Wraps the TraCI domains and simulationStep to time every call"""
+        for domain_name in DOMAINS:
+            domain = getattr(traci, domain_name, None)
+            if domain is None:
+                continue
+            for name in dir(domain):
+                if name.startswith('_') or 'SubscriptionResults' in name:
+                    continue
+                method = getattr(domain, name)
+                if not callable(method):
+                    continue
+                phase = 'query' if name.startswith(QUERY_PREFIXES) else 'actuate'
+                # the libsumo domains are classes, their own methods are put back
+                original = vars(domain).get(name)
+                setattr(domain, name, self._timed(method, domain_name + '.' + name, phase))
+                self._wrapped.append((domain, name, original))
+        self._simulation_step = traci.simulationStep
+        traci.simulationStep = self._timed_step
+        self._started = time.time()
+
+    def uninstall(self):
+        """Restores the TraCI functions replaced by install"""
+        for domain, name, original in self._wrapped:
+            if original is None:
+                delattr(domain, name)
+            else:
+                setattr(domain, name, original)
+        self._wrapped = []
+        del traci.simulationStep
+
+    def wrap(self, controller):
+        """Returns the controller with its steps timed as the decide phase"""
+        return TimedController(controller, self)
+
+    def _timed(self, method, command, phase):
+        def timed(*args, **kwargs):
+            if self._depth:
+                return method(*args, **kwargs)
+            self._depth += 1
+            start = time.time()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._depth -= 1
+                self.elapsed[phase] += time.time() - start
+                self.calls[command] += 1
+                self.step_calls += 1
+        return timed
+
+    def _timed_step(self, *args, **kwargs):
+        start = time.time()
+        try:
+            return self._simulation_step(*args, **kwargs)
+        finally:
+            self.elapsed['simulate'] += time.time() - start
+            self.calls['simulationStep'] += 1
+            self.timeline.append(tuple(self.elapsed[phase] for phase in PHASES) + (self.step_calls,))
+            self.elapsed = dict.fromkeys(PHASES, 0.)
+            self.step_calls = 0
+
+    def summary(self):
+        """Returns totals, means and percentiles of every phase in seconds"""
+        summary = {
+            'steps': len(self.timeline),
+            'wall': time.time() - self._started if self._started else 0.,
+            'calls': dict(self.calls),
+            'calls_per_step': (float(sum(row[-1] for row in self.timeline)) / len(self.timeline)
+                               if self.timeline else 0.),
+            'phases': {},
+        }
+        for column, phase in enumerate(PHASES):
+            values = sorted(row[column] for row in self.timeline)
+            stats = {
+                'total': sum(values),
+                'mean': sum(values) / len(values) if values else 0.,
+            }
+            for q in PERCENTILES:
+                stats['p{0}'.format(q)] = percentile(values, q)
+            summary['phases'][phase] = stats
+        return summary
+
+    def report(self):
+        """Returns the summary as a few lines of text"""
+        summary = self.summary()
+        lines = ["{0} steps in {1:.2f}s, {2:.1f} TraCI calls per step".format(
+            summary['steps'], summary['wall'], summary['calls_per_step'])]
+        for phase in PHASES:
+            stats = summary['phases'][phase]
+            lines.append("  {0:<8} total {1:8.3f}s  mean {2:8.3f}ms  p50 {3:8.3f}ms  p90 {4:8.3f}ms  p99 {5:8.3f}ms".format(
+                phase, stats['total'], stats['mean'] * 1e3, stats['p50'] * 1e3,
+                stats['p90'] * 1e3, stats['p99'] * 1e3))
+        for command, count in self.calls.most_common(10):
+            lines.append("  {0:<40} {1:10d}".format(command, count))
+        return '\n'.join(lines)
+
+    def write(self, summary_file, timeline_file):
+        """Writes the summary as JSON and the per-step timings as CSV"""
+        with open(summary_file, 'w') as output:
+            json.dump(self.summary(), output, indent=2, sort_keys=True)
+        with open(timeline_file, 'w') as output:
+            writer = csv.writer(output, delimiter=';', lineterminator='\n')
+            writer.writerow(('step',) + PHASES + ('calls',))
+            for step, row in enumerate(self.timeline):
+                writer.writerow((step,) + tuple('{0:.6f}'.format(value) for value in row[:-1]) + row[-1:])
+
+
+class TimedController(Controller):
+    """Runs a controller, booking its own time to the decide phase"""
+
+    def __init__(self, controller, instrumentation):
+        self.controller = controller
+        self.instrumentation = instrumentation
+
+    def start(self):
+        self.controller.start()
+
+    def step(self, step):
+        elapsed = self.instrumentation.elapsed
+        traci_before = elapsed['query'] + elapsed['actuate']
+        start = time.time()
+        self.controller.step(step)
+        spent = time.time() - start
+        traci_spent = elapsed['query'] + elapsed['actuate'] - traci_before
+        elapsed['decide'] += spent - traci_spent
+
+    def idle(self):
+        return self.controller.idle()
+
+    def finish(self):
+        self.controller.finish()
+
+    def stats(self):
+        return self.controller.stats()
+
+
+class Profiler(object):
+    """Runs cProfile around a block and dumps the stats to a file, does
+    nothing without a file"""
+
+    def __init__(self, stats_file=None):
+        self.stats_file = stats_file
+        self.profile = cProfile.Profile() if stats_file else None
+
+    def __enter__(self):
+        if self.profile is not None:
+            self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(self.stats_file)
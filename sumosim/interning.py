@@ -0,0 +1,58 @@
+"""Dense integer numbers for SUMO IDs.
+
+SUMO names edges, lanes and vehicles by strings, OSM ones like
+'-155366787#14_0' among them, which are slow to hash and take room in every
+table keyed by them. The controller numbers every ID once, when the network
+is read or when a vehicle departs, and keys its state by the numbers, so its
+tables are lists indexed by number. The IDs are only looked up again to talk
+to SUMO.
+
+The numbers of arrived vehicles are given to the next departing ones, so the
+vehicle tables never grow past the number of vehicles in the network at once.
+"""
+from __future__ import absolute_import
+
+
+class Interner(object):
+    """Numbers IDs 0, 1, 2... in the order they are first seen"""
+
+    __slots__ = ('numbers', 'ids', 'free')
+
+    def __init__(self, ids=()):
+        self.numbers = {}
+        self.ids = []
+        self.free = []
+        for id_ in ids:
+            self.intern(id_)
+
+    def intern(self, id_):
+        """Returns the number of the ID, numbering it if it is new"""
+        number = self.numbers.get(id_)
+        if number is None:
+            if self.free:
+                number = self.free.pop()
+                self.ids[number] = id_
+            else:
+                number = len(self.ids)
+                self.ids.append(id_)
+            self.numbers[id_] = number
+        return number
+
+    def get(self, id_, default=None):
+        """Returns the number of the ID, or 'default' if it is not numbered"""
+        return self.numbers.get(id_, default)
+
+    def release(self, id_):
+        """Forgets the ID, its number is reused by the next new ID. Returns
+        the number, or None if the ID was not numbered"""
+        number = self.numbers.pop(id_, None)
+        if number is not None:
+            self.ids[number] = None
+            self.free.append(number)
+        return number
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, id_):
+        return id_ in self.numbers
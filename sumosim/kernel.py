@@ -0,0 +1,98 @@
+"""Vectorized decisions of the priority lane algorithm.
+
+The per-step state the algorithm decides on is held in NumPy arrays over the
+priority lanes of the network, in network order: the edge of every lane, the
+number of priority and of standard vehicles on it and whether it is closed.
+The vehicle counts follow the moves found by the ChangeTracker, the
+closed flags the writes of PriorityAccess.
+
+The decisions for all changed edges are then taken in one pass over the
+arrays: an edge with a priority vehicle on its priority lanes is closed and
+its lanes with standard vehicles cleaned, a changed edge with a closed lane
+and no priority vehicle is opened. The controller only runs Python code for
+the resulting actions, so its overhead no longer grows with the number of
+edges and lanes it checks.
+"""
+from __future__ import absolute_import
+
+from collections import namedtuple
+
+import numpy as np
+
+# an edge number to close, or to open, and the lanes to clean of standard vehicles
+Action = namedtuple('Action', ['edge', 'close', 'clean'])
+
+
+class DecisionKernel(object):
+    """Vehicle counts and closed flags of the priority lanes, and the
+    decisions taken on them.
+
+    With 'recheck_open' every changed edge without a priority vehicle is
+    returned for opening, as corridor holds placed by the edges acted on
+    before it in the same step may close its lanes; the controller checks
+    those edges for closed lanes when it gets to them"""
+
+    def __init__(self, lane_index, priority_access, vehicles, recheck_open=False):
+        self.edges = len(lane_index.edge_ids)
+        self.vehicles = vehicles
+        self.recheck_open = recheck_open
+        self.lanes = lane_index.all_priority_lanes()
+        # lane number -> position in the arrays
+        self.positions = dict((lane, position) for position, lane in enumerate(self.lanes))
+        self.lane_edge = np.array([lane_index.lane_edge[lane] for lane in self.lanes],
+                                  dtype=np.int64)
+        self.priority = np.zeros(len(self.lanes), dtype=np.int64)
+        self.standard = np.zeros(len(self.lanes), dtype=np.int64)
+        self.closed = np.array([priority_access.states[lane] == priority_access.CLOSED
+                                for lane in self.lanes], dtype=bool)
+        self.dirty = np.zeros(self.edges, dtype=bool)
+        self.actions = 0
+        priority_access.on_change = self.set_closed
+
+    def set_closed(self, lane, closed):
+        self.closed[self.positions[lane]] = closed
+
+    def move(self, moves):
+        """Takes the (vehicle, old lane, new lane) moves of the last step, by
+        number, NO_LANE for a vehicle entering or leaving the priority lanes"""
+        counts = ([], [], [], [])
+        positions = self.positions
+        for vehicle, old_lane, lane in moves:
+            old_position = positions.get(old_lane)
+            position = positions.get(lane)
+            if old_position is None and position is None:
+                continue
+            offset = 0 if self.vehicles.info(vehicle).priority else 2
+            if old_position is not None:
+                counts[offset].append(old_position)
+            if position is not None:
+                counts[offset + 1].append(position)
+        np.subtract.at(self.priority, counts[0], 1)
+        np.add.at(self.priority, counts[1], 1)
+        np.subtract.at(self.standard, counts[2], 1)
+        np.add.at(self.standard, counts[3], 1)
+
+    def decide(self, dirty_edges):
+        """Returns the actions for the changed edges, by number, in network
+        order"""
+        dirty = self.dirty
+        dirty[:] = False
+        dirty[dirty_edges] = True
+        edges = self.edges
+        has_priority = np.bincount(self.lane_edge, weights=self.priority, minlength=edges) > 0
+        close = dirty & has_priority
+        open_ = dirty & ~has_priority
+        if self.recheck_open:
+            open_ &= np.bincount(self.lane_edge, minlength=edges) > 0
+        else:
+            open_ &= np.bincount(self.lane_edge, weights=self.closed, minlength=edges) > 0
+        clean = {}
+        for position in np.flatnonzero(close[self.lane_edge] & (self.standard > 0)).tolist():
+            clean.setdefault(int(self.lane_edge[position]), []).append(self.lanes[position])
+        actions = [Action(edge, bool(close[edge]), clean.get(edge, ()))
+                   for edge in np.flatnonzero(close | open_).tolist()]
+        self.actions += len(actions)
+        return actions
+
+    def stats(self):
+        return {'kernel_actions': self.actions}
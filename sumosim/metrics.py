@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""Aggregate trip metrics from SUMO tripinfo outputs.
+
+The tripinfo files are streamed with iterparse and every element is dropped
+as soon as it is read, so memory does not grow with the DOM: only one float
+per trip and metric is kept, which is what exact percentiles need.
+
+    python -m sumosim.metrics grid-4 --csv grid-4-metrics.csv
+    python -m sumosim.metrics --files run-0.xml run-1.xml run-2.xml
+    python -m sumosim.metrics --files new-0.xml new-1.xml --baseline old-0.xml,old-1.xml
+
+For every vType (and 'all') the mean and p50/p90/p99 of each metric are
+computed per run, then averaged across the runs (seeds) with a 95%
+confidence interval of the mean.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import csv
+import sys
+import optparse
+from array import array
+from collections import defaultdict
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+from sumosim import scenarios
+from sumosim.stats import mean, percentile, confidence_interval
+
+METRICS = ('duration', 'timeLoss', 'waitSteps', 'rerouteNo', 'departDelay')
+# newer SUMO versions report waitingCount instead of waitSteps
+FALLBACKS = {'waitSteps': 'waitingCount'}
+PERCENTILES = (50, 90, 99)
+ALL = 'all'
+
+
+def iter_tripinfos(path):
+    """Yields the attributes of every tripinfo element of the file. The trips
+    of a file cut short by an aborted run are used up to the broken element"""
+    context = ElementTree.iterparse(path, events=('start', 'end'))
+    try:
+        _, root = next(context)
+        for event, element in context:
+            if event == 'end' and element.tag == 'tripinfo':
+                yield element.attrib
+                root.clear()
+    except ElementTree.ParseError as error:
+        print("{0} is incomplete ({1}), using the trips before the error".format(path, error),
+              file=sys.stderr)
+
+
+def get_metric(trip, metric):
+    value = trip.get(metric)
+    if value is None and metric in FALLBACKS:
+        value = trip.get(FALLBACKS[metric])
+    return float(value) if value is not None else None
+
+
+class TripSummary(object):
+    """Values of the trip metrics of one run by vType"""
+
+    def __init__(self):
+        self.values = defaultdict(lambda: dict((metric, array('d')) for metric in METRICS))
+
+    def add(self, trip):
+        for vtype in (trip.get('vType'), ALL):
+            values = self.values[vtype]
+            for metric in METRICS:
+                value = get_metric(trip, metric)
+                if value is not None:
+                    values[metric].append(value)
+
+    def stats(self):
+        """Returns {vType: {metric: {'count', 'mean', 'p50', ...}}}"""
+        result = {}
+        for vtype, values in self.values.items():
+            result[vtype] = {}
+            for metric, metric_values in values.items():
+                ordered = sorted(metric_values)
+                stats = {'count': len(ordered), 'mean': mean(ordered)}
+                for q in PERCENTILES:
+                    stats['p{0}'.format(q)] = percentile(ordered, q)
+                result[vtype][metric] = stats
+        return result
+
+
+def summarize_tripinfo(path):
+    """Returns the per-vType statistics of one tripinfo file"""
+    summary = TripSummary()
+    for trip in iter_tripinfos(path):
+        summary.add(trip)
+    return summary.stats()
+
+
+def aggregate_runs(runs):
+    """Combines the statistics of several runs (seeds) of the same variant.
+
+    Returns {vType: {metric: {'runs', 'trips', 'mean', 'ci95', 'p50', ...}}}
+    where every value is the mean over the runs and 'ci95' is the half width
+    of the 95% confidence interval of the mean"""
+    by_metric = defaultdict(lambda: defaultdict(list))
+    for run in runs:
+        for vtype, metrics in run.items():
+            for metric, stats in metrics.items():
+                if stats['count']:
+                    by_metric[vtype][metric].append(stats)
+    result = {}
+    for vtype, metrics in by_metric.items():
+        result[vtype] = {}
+        for metric, per_run in metrics.items():
+            means = [stats['mean'] for stats in per_run]
+            aggregate = {
+                'runs': len(per_run),
+                'trips': sum(stats['count'] for stats in per_run),
+                'mean': mean(means),
+                'ci95': confidence_interval(means),
+            }
+            for q in PERCENTILES:
+                key = 'p{0}'.format(q)
+                aggregate[key] = mean([stats[key] for stats in per_run])
+            result[vtype][metric] = aggregate
+    return result
+
+
+def compare(aggregate, baseline):
+    """Yields (vType, metric, baseline mean, mean, relative change) for the
+    metrics found in both aggregates"""
+    for vtype in sorted(aggregate):
+        for metric in METRICS:
+            if metric in aggregate[vtype] and metric in baseline.get(vtype, {}):
+                before = baseline[vtype][metric]['mean']
+                after = aggregate[vtype][metric]['mean']
+                yield vtype, metric, before, after, (after - before) / before if before else None
+
+
+def scenario_outputs(scenario, algorithm, seeds=None):
+    """Returns the existing tripinfo outputs of a scenario variant"""
+    paths = [scenario.output_file(algorithm, seed) for seed in seeds or scenario.seeds]
+    return [path for path in paths if os.path.exists(path)]
+
+
+COLUMNS = ('source', 'vType', 'metric', 'runs', 'trips', 'mean', 'ci95') + tuple(
+    'p{0}'.format(q) for q in PERCENTILES)
+
+
+def rows(source, aggregate):
+    for vtype in sorted(aggregate):
+        for metric in METRICS:
+            if metric in aggregate[vtype]:
+                stats = aggregate[vtype][metric]
+                yield (source, vtype, metric) + tuple(stats[column] for column in COLUMNS[3:])
+
+
+def get_options(args=None):
+    optParser = optparse.OptionParser(usage="%prog [options] [<scenario> ...]")
+    optParser.add_option("--files", action="store_true", default=False,
+                         help="treat the arguments as tripinfo files of the runs of one variant")
+    optParser.add_option("--seeds",
+                         help="comma separated seeds to read [default: the scenario's seeds]")
+    optParser.add_option("--baseline",
+                         help="comma separated tripinfo files to compare the --files runs against")
+    optParser.add_option("--csv", help="also write the table to this file, semicolon separated")
+    options, args = optParser.parse_args(args)
+    if not args:
+        optParser.error("expected scenarios or tripinfo files")
+    if options.baseline and not options.files:
+        optParser.error("--baseline needs --files")
+    if options.seeds is not None:
+        options.seeds = [int(seed) for seed in options.seeds.split(',')]
+    options.args = args
+    return options
+
+
+def main(args=None):
+    options = get_options(args)
+    table = []
+    if options.files:
+        runs = [summarize_tripinfo(path) for path in options.args]
+        aggregate = aggregate_runs(runs)
+        table.extend(rows('files', aggregate))
+        if options.baseline:
+            baseline = aggregate_runs(
+                [summarize_tripinfo(path) for path in options.baseline.split(',')])
+            table.extend(rows('baseline', baseline))
+    else:
+        for name in options.args:
+            scenario = scenarios.get_scenario(name)
+            for algorithm in (True, False):
+                paths = scenario_outputs(scenario, algorithm, options.seeds)
+                if not paths:
+                    continue
+                source = '{0}-{1}'.format(name, 'algorithm' if algorithm else 'no-algorithm')
+                table.extend(rows(source, aggregate_runs([summarize_tripinfo(path) for path in paths])))
+    for row in table:
+        print("{0:<28} {1:<16} {2:<12} runs {3:2d} trips {4:7d} mean {5:10.2f} +- {6:8.2f}  "
+              "p50 {7:10.2f} p90 {8:10.2f} p99 {9:10.2f}".format(*row))
+    if options.files and options.baseline:
+        for vtype, metric, before, after, change in compare(aggregate, baseline):
+            print("{0:<16} {1:<12} {2:10.2f} -> {3:10.2f}  {4}".format(
+                vtype, metric, before, after,
+                '{0:+.1%}'.format(change) if change is not None else 'n/a'))
+    if options.csv:
+        with open(options.csv, 'w') as output:
+            writer = csv.writer(output, delimiter=';', lineterminator='\n')
+            writer.writerow(COLUMNS)
+            writer.writerows(table)
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Static tables derived from the SUMO network file.
+
+Parsing a net file with sumolib dominates the start of a run on the larger
+networks, so the tables the controllers need are kept in a NetworkModel that
+is cached on disk, keyed by the contents of the net file. During a run the
+edges and lanes are known by their numbers in network order, see
+sumosim.interning.
+"""
+from __future__ import absolute_import
+
+import os
+from array import array
+from collections import namedtuple
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+import sumolib
+
+from sumosim import cache
+from sumosim.interning import Interner
+
+PRIORITY_TYPES = frozenset(['bus', 'emergency', 'taxi'])
+NON_PRIORITY_TYPES = frozenset(['private', 'evehicle', 'passenger', 'truck'])
+
+# bump whenever the attributes of NetworkModel change to invalidate the cache
+MODEL_VERSION = 5
+
+# lane number of a vehicle on none of the network's lanes
+NO_LANE = -1
+
+EdgeLanes = namedtuple('EdgeLanes', ['lanes', 'priority_lanes', 'non_priority_lanes'])
+
+
+def read_net(netfile):
+    """Parses the network file"""
+    return sumolib.net.readNet(netfile)
+
+
+def read_allowed(netfile):
+    """Returns the classes of every lane with an 'allow' attribute.
+
+    SUMO ignores the 'disallow' of a lane that has 'allow', while sumolib
+    applies 'disallow' then, so a lane with allow="bus" disallow="private"
+    allows every class but private in sumolib and only buses in SUMO"""
+    allowed = {}
+    for _, element in ElementTree.iterparse(netfile):
+        if element.tag == 'lane':
+            allow = element.get('allow')
+            if allow is not None:
+                classes = allow.split()
+                if 'all' in classes:
+                    classes = sumolib.net.lane.SUMO_VEHICLE_CLASSES
+                allowed[element.get('id')] = frozenset(classes)
+        element.clear()
+    return allowed
+
+
+def parse_network(netfile):
+    """Returns the NetworkModel of the net file, with SUMO's permissions"""
+    return NetworkModel(read_net(netfile), read_allowed(netfile))
+
+
+def load_network(netfile, use_cache=True, cache_dir=None):
+    """Returns the NetworkModel of the net file, read from the cache unless
+    the file changed since it was last parsed"""
+    if not use_cache:
+        return parse_network(netfile)
+    path = cache.entry_path('network', os.path.basename(netfile),
+                            cache.digest([netfile], MODEL_VERSION), cache_dir=cache_dir)
+    network = cache.load_pickle(path)
+    if network is None:
+        network = parse_network(netfile)
+        cache.dump_pickle(network, path)
+    return network
+
+
+def is_priority_lane(allowed):
+    """Returns whether a lane allowing the given classes is a priority lane"""
+    return bool(allowed & PRIORITY_TYPES) and not allowed & NON_PRIORITY_TYPES
+
+
+def get_priority_lanes(lanes, lane_index):
+    """Takes a list of lane numbers and returns priority lanes, according to the
+    permissions currently recorded in the lane index"""
+    return [lane for lane in lanes if is_priority_lane(lane_index.allowed[lane])]
+
+
+class NetworkModel(object):
+    """Edges and lanes of a network with the permissions from the net file,
+    the length and speed limit of every edge and the priority lanes every
+    priority lane leads to. 'allowed' overrides the sumolib permissions of
+    lanes, see read_allowed"""
+
+    def __init__(self, net, allowed=None):
+        allowed = allowed or {}
+        self.edge_ids = tuple(edge.getID() for edge in net.getEdges())
+        self.lane_ids = tuple(lane.getID() for edge in net.getEdges() for lane in edge.getLanes())
+        self.edges = {}
+        self.indices = {}
+        self.permissions = {}
+        self.lengths = {}
+        self.speeds = {}
+        for edge in net.getEdges():
+            self.lengths[edge.getID()] = edge.getLength()
+            self.speeds[edge.getID()] = edge.getSpeed()
+            for lane in edge.getLanes():
+                self.indices[lane.getID()] = lane.getIndex()
+                self.permissions[lane.getID()] = allowed.get(
+                    lane.getID(), frozenset(lane.getPermissions()))
+            lanes = tuple(lane.getID() for lane in edge.getLanes())
+            priority_lanes = tuple(
+                lane for lane in lanes if is_priority_lane(self.permissions[lane]))
+            self.edges[edge.getID()] = EdgeLanes(
+                lanes, priority_lanes,
+                tuple(lane for lane in lanes if lane not in priority_lanes))
+        self.priority_successors = {}
+        for edge in net.getEdges():
+            for lane in edge.getLanes():
+                if is_priority_lane(self.permissions[lane.getID()]):
+                    successors = []
+                    for connection in lane.getOutgoing():
+                        to_lane = connection.getToLane().getID()
+                        if (is_priority_lane(self.permissions.get(to_lane, frozenset()))
+                                and to_lane not in successors):
+                            successors.append(to_lane)
+                    self.priority_successors[lane.getID()] = tuple(successors)
+
+
+class PriorityLaneGraph(object):
+    """Priority lane to priority lane links of the network, by lane number,
+    with the corridors, the priority lanes up to 'hops' links ahead of a lane,
+    cached once looked up"""
+
+    def __init__(self, network, lane_numbers):
+        self.successors = dict(
+            (lane_numbers.get(lane), tuple(lane_numbers.get(successor) for successor in successors))
+            for lane, successors in network.priority_successors.items())
+        self.corridors = {}
+
+    def corridor(self, lane, hops):
+        """Returns the priority lanes reachable from the lane within 'hops'
+        links, nearest first, without the lane itself"""
+        key = (lane, hops)
+        corridor = self.corridors.get(key)
+        if corridor is None:
+            seen = set([lane])
+            corridor = []
+            frontier = [lane]
+            for _ in range(hops):
+                next_frontier = []
+                for current in frontier:
+                    for successor in self.successors.get(current, ()):
+                        if successor not in seen:
+                            seen.add(successor)
+                            corridor.append(successor)
+                            next_frontier.append(successor)
+                frontier = next_frontier
+            corridor = self.corridors[key] = tuple(corridor)
+        return corridor
+
+
+class LaneIndex(object):
+    """Lanes of every edge and their permissions during a run.
+
+    Edges and lanes are numbered in network order and every table is a list
+    or array indexed by number; 'edge_ids' and 'lane_ids' give the SUMO IDs
+    back, 'edge_numbers' and 'lane_numbers' the numbers of IDs.
+
+    The lane layout never changes during a run. The allowed classes start from
+    the net file and are only updated through update_allowed, when the
+    controller itself calls setAllowed, so they always match SUMO"""
+
+    def __init__(self, network):
+        self.edge_numbers = Interner(network.edge_ids)
+        self.lane_numbers = Interner(network.lane_ids)
+        self.edge_ids = self.edge_numbers.ids
+        self.lane_ids = self.lane_numbers.ids
+        number = self.lane_numbers.numbers
+        self.edge_lanes = [tuple(number[lane] for lane in network.edges[edge_id].lanes)
+                           for edge_id in self.edge_ids]
+        self.priority_lanes = [tuple(number[lane] for lane in network.edges[edge_id].priority_lanes)
+                               for edge_id in self.edge_ids]
+        self.lane_edge = array('l', [0] * len(self.lane_ids))
+        for edge, lanes in enumerate(self.edge_lanes):
+            for lane in lanes:
+                self.lane_edge[lane] = edge
+        self.indices = array('l', [network.indices[lane] for lane in self.lane_ids])
+        self.allowed = [network.permissions[lane] for lane in self.lane_ids]
+
+    def all_priority_lanes(self):
+        """Returns the priority lanes of the network in network order"""
+        return [lane for lanes in self.priority_lanes for lane in lanes]
+
+    def priority_edges(self):
+        """Returns the edges with priority lanes in network order"""
+        return [edge for edge, lanes in enumerate(self.priority_lanes) if lanes]
+
+    def update_allowed(self, lane, allowed):
+        """Records the classes the controller has allowed on the lane"""
+        self.allowed[lane] = frozenset(allowed)
@@ -0,0 +1,93 @@
+"""Rate-limited progress reports of a running simulation.
+
+Reports are single JSON lines so a progress file can be followed with
+`tail -f` and parsed afterwards. The reporter looks at the wall clock once
+per step and only talks to TraCI and the output when a report is due.
+"""
+from __future__ import absolute_import
+
+import sys
+import json
+import time
+
+from sumosim.backend import traci
+
+QUIET = 0
+NORMAL = 1
+VERBOSE = 2
+
+
+class ProgressReporter(object):
+    """Reports the progress of a run every 'interval' seconds of wall time.
+
+    QUIET writes nothing, NORMAL writes periodic progress lines and a final
+    line with the controller's action counters, VERBOSE adds the counters to
+    every progress line"""
+
+    def __init__(self, stream=None, interval=10., verbosity=NORMAL, label=None):
+        self.stream = stream or sys.stdout
+        self.interval = interval
+        self.verbosity = verbosity
+        self.label = label
+        self._started = None
+        self._first = 0
+        self._last = None
+        self.steps = None
+        self.wall = None
+
+    def start(self, expected, step=0):
+        """Called before the first step, 'step' is the first step number"""
+        self._started = time.time()
+        self._first = step
+        self._last = (self._started, step, expected)
+
+    def update(self, step, expected, controller=None):
+        """Called after every simulation step with the vehicles still expected"""
+        if self.verbosity < NORMAL:
+            return
+        now = time.time()
+        last_time, last_step, last_expected = self._last
+        elapsed = now - last_time
+        if elapsed < self.interval or elapsed <= 0:
+            return
+        drained = last_expected - expected
+        report = {
+            'event': 'progress',
+            'step': step,
+            'wall': round(now - self._started, 3),
+            'steps_per_s': round((step - last_step) / elapsed, 1),
+            'vehicles': traci.vehicle.getIDCount(),
+            'expected': expected,
+            # at the rate the expected vehicles drained since the last report
+            'eta': round(expected * elapsed / drained, 1) if drained > 0 else None,
+        }
+        if self.verbosity >= VERBOSE and controller is not None:
+            report['actions'] = controller.stats()
+        self._write(report)
+        self._last = (now, step, expected)
+
+    def finish(self, step, controller=None, schedule=None):
+        """Records the steps and wall time of the run and reports them, with
+        the counters of the controller and of its ControlSchedule"""
+        wall = time.time() - self._started
+        self.steps = step - self._first
+        self.wall = wall
+        if self.verbosity < NORMAL:
+            return
+        report = {
+            'event': 'done',
+            'step': step,
+            'wall': round(wall, 3),
+            'steps_per_s': round(self.steps / wall, 1) if wall > 0 else None,
+        }
+        if controller is not None:
+            report['actions'] = controller.stats()
+        if schedule is not None:
+            report['schedule'] = schedule.stats()
+        self._write(report)
+
+    def _write(self, report):
+        if self.label is not None:
+            report['run'] = self.label
+        self.stream.write(json.dumps(report, sort_keys=True) + '\n')
+        self.stream.flush()
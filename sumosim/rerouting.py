@@ -0,0 +1,108 @@
+"""Batched and throttled rerouting of the vehicles on changed edges.
+
+rerouteTraveltime runs a full shortest path search per vehicle inside SUMO,
+which makes it the most expensive action of the algorithm. The scheduler
+collects the reroute requests of a step and sends them together once all
+travel times of the step have been updated:
+
+* a vehicle requested by several edges in a step is rerouted once
+* a vehicle rerouted less than 'cooldown' steps ago is not rerouted again
+* at most 'budget' vehicles are rerouted per step, the rest wait, first
+  requested first served, for the next steps
+* with 'route_filter' a vehicle is only rerouted when the rest of its route,
+  after the edge it is on, uses an edge that changed in the step
+
+Given the 'vehicle_ids' of a VehicleCache the vehicles are requested by
+their numbers, see sumosim.interning, and only turned into IDs to be sent.
+Given a CommandQueue the reroutes are queued on it, see sumosim.actuation.
+"""
+from __future__ import absolute_import
+
+from sumosim.backend import traci
+
+
+class RerouteScheduler(object):
+    """Collects the reroute requests of a step and sends the useful ones"""
+
+    def __init__(self, cooldown=0, budget=None, route_filter=False, vehicle_ids=None,
+                 commands=None):
+        self.cooldown = cooldown
+        self.vehicle_ids = vehicle_ids
+        self.commands = commands
+        self.budget = budget
+        self.route_filter = route_filter
+        # insertion ordered, the pending vehicles in request order
+        self.pending = {}
+        self.affected = set()
+        self.last_reroute = {}
+        self.requested = 0
+        self.reroutes = 0
+        self.duplicates = 0
+        self.cooling = 0
+        self.filtered = 0
+        self.gone = 0
+
+    def request(self, edge_id, vehicles, step):
+        """Asks for the vehicles on a changed edge to be rerouted"""
+        self.affected.add(edge_id)
+        for vehicle in vehicles:
+            self.requested += 1
+            if vehicle in self.pending:
+                self.duplicates += 1
+            elif self.cooldown and step - self.last_reroute.get(vehicle, -self.cooldown) < self.cooldown:
+                self.cooling += 1
+            else:
+                self.pending[vehicle] = None
+
+    def flush(self, step, arrived=()):
+        """Reroutes the pending vehicles within the budget, called once per
+        step after all requests"""
+        for vehicle in arrived:
+            if vehicle in self.pending:
+                del self.pending[vehicle]
+                self.gone += 1
+            self.last_reroute.pop(vehicle, None)
+        sent = 0
+        for vehicle in list(self.pending):
+            if self.budget is not None and sent >= self.budget:
+                break
+            del self.pending[vehicle]
+            vehicle_id = self.vehicle_ids[vehicle] if self.vehicle_ids is not None else vehicle
+            try:
+                if self.route_filter and not self._route_affected(vehicle_id):
+                    self.filtered += 1
+                    continue
+                if self.commands is not None:
+                    # a vehicle gone by then is counted by the queue
+                    self.commands.put('rerouteTraveltime', vehicle_id,
+                                      traci.vehicle.rerouteTraveltime, (vehicle_id,), may_fail=True)
+                else:
+                    traci.vehicle.rerouteTraveltime(vehicle_id)
+            except traci.TraCIException:
+                # the vehicle left the network while it waited for the budget
+                self.gone += 1
+                continue
+            sent += 1
+            if self.cooldown:
+                self.last_reroute[vehicle] = step
+        self.reroutes += sent
+        if not self.pending:
+            self.affected = set()
+        if self.cooldown and step % self.cooldown == 0:
+            self.last_reroute = dict(
+                (vehicle, last) for vehicle, last in self.last_reroute.items()
+                if step - last < self.cooldown)
+        return sent
+
+    def _route_affected(self, vehicle):
+        route = traci.vehicle.getRoute(vehicle)
+        index = traci.vehicle.getRouteIndex(vehicle)
+        return not self.affected.isdisjoint(route[index + 1:])
+
+    def stats(self):
+        return {
+            'reroutes': self.reroutes,
+            'reroutes_requested': self.requested,
+            'reroutes_saved': self.duplicates + self.cooling + self.filtered + self.gone,
+            'reroutes_waiting': len(self.pending),
+        }
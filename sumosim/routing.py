@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""Routes the trips of a scenario once, instead of at every insertion.
+
+A scenario listing trip files in its scenario.json would have SUMO compute
+the route of every trip when it is inserted, in every run. Here the trips
+are turned into a route file once, with duarouter when it is installed or
+with a shortest travel time search over the sumolib network otherwise, and
+cached keyed by the contents of the net and trip files. The runner hands the
+cached routes to SUMO in place of the trips.
+
+    python -m sumosim.routing manchester
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import heapq
+import optparse
+import subprocess
+from collections import defaultdict
+from xml.sax.saxutils import quoteattr
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+from sumosim import cache
+from sumosim import scenarios
+from sumosim import find_binary
+
+ROUTERS = ('auto', 'duarouter', 'local')
+# bump whenever the routes of the local router change to invalidate the cache
+ROUTING_VERSION = 1
+DEFAULT_VCLASS = 'passenger'
+
+
+def route_with_duarouter(duarouter, netfile, trip_files, output_file):
+    """Routes the trips with duarouter, dropping unroutable trips"""
+    subprocess.check_call([duarouter, '--net-file', netfile,
+                           '--route-files', ','.join(trip_files),
+                           '--output-file', output_file,
+                           '--ignore-errors', '--no-warnings', '--no-step-log'])
+
+
+def read_trips(trip_files):
+    """Returns the vTypes and the trips of the files, the trips sorted by
+    departure, as lists of attribute dicts"""
+    vtypes = []
+    trips = []
+    for path in trip_files:
+        for _, element in ElementTree.iterparse(path):
+            if element.tag == 'vType':
+                vtypes.append(dict(element.attrib))
+            elif element.tag == 'trip':
+                trips.append(dict(element.attrib))
+            element.clear()
+    trips.sort(key=lambda trip: float(trip.get('depart', 0)))
+    return vtypes, trips
+
+
+def shortest_paths(net, origin, destinations, vclass):
+    """Returns {destination: edge ids} of the fastest routes from the origin
+    edge, searching until all destinations are settled"""
+    start = net.getEdge(origin)
+    remaining = set(destinations)
+    costs = {start: start.getLength() / start.getSpeed()}
+    previous = {}
+    queue = [(costs[start], origin, start)]
+    settled = set()
+    paths = {}
+    while queue and remaining:
+        cost, edge_id, edge = heapq.heappop(queue)
+        if edge in settled:
+            continue
+        settled.add(edge)
+        if edge_id in remaining:
+            remaining.discard(edge_id)
+            path = [edge_id]
+            on_path = edge
+            while on_path in previous:
+                on_path = previous[on_path]
+                path.append(on_path.getID())
+            paths[edge_id] = path[::-1]
+        for successor in edge.getOutgoing():
+            if successor in settled or not successor.allows(vclass):
+                continue
+            successor_cost = cost + successor.getLength() / successor.getSpeed()
+            if successor_cost < costs.get(successor, float('inf')):
+                costs[successor] = successor_cost
+                previous[successor] = edge
+                heapq.heappush(queue, (successor_cost, successor.getID(), successor))
+    return paths
+
+
+def route_locally(netfile, trip_files, output_file):
+    """Routes the trips with one search per origin and vehicle class over
+    the sumolib network, dropping unroutable trips. Returns the number of
+    routed trips"""
+    # sumolib is only needed for the local router
+    from sumosim.network import read_net
+    net = read_net(netfile)
+    vtypes, trips = read_trips(trip_files)
+    vclasses = dict((vtype['id'], vtype.get('vClass', DEFAULT_VCLASS)) for vtype in vtypes)
+    wanted = defaultdict(set)
+    for trip in trips:
+        wanted[trip['from'], vclasses.get(trip.get('type'), DEFAULT_VCLASS)].add(trip['to'])
+    routes = {}
+    for (origin, vclass), destinations in wanted.items():
+        if net.hasEdge(origin):
+            for destination, path in shortest_paths(net, origin, destinations, vclass).items():
+                routes[origin, destination, vclass] = path
+    routed = 0
+    with open(output_file, 'w') as output:
+        output.write('<routes>\n')
+        for vtype in vtypes:
+            output.write('    <vType {0}/>\n'.format(' '.join(
+                '{0}={1}'.format(key, quoteattr(value)) for key, value in sorted(vtype.items()))))
+        for trip in trips:
+            vclass = vclasses.get(trip.get('type'), DEFAULT_VCLASS)
+            path = routes.get((trip['from'], trip['to'], vclass))
+            if path is None:
+                continue
+            attributes = ' '.join('{0}={1}'.format(key, quoteattr(value))
+                                  for key, value in sorted(trip.items())
+                                  if key not in ('from', 'to', 'via'))
+            output.write('    <vehicle {0}>\n        <route edges="{1}"/>\n    </vehicle>\n'.format(
+                attributes, ' '.join(path)))
+            routed += 1
+        output.write('</routes>\n')
+    return routed
+
+
+def find_router(router='auto'):
+    """Returns the duarouter binary to route with, or None for the local router"""
+    if router not in ROUTERS:
+        raise ValueError("unknown router '{0}', expected one of {1}".format(router, ', '.join(ROUTERS)))
+    duarouter = find_binary('duarouter') if router in ('auto', 'duarouter') else None
+    if router == 'duarouter' and duarouter is None:
+        raise RuntimeError("duarouter was not found, set SUMO_HOME or add it to the PATH")
+    return duarouter
+
+
+def route_trips(duarouter, netfile, trip_files, output_file):
+    """Routes the trips with duarouter, or with the local router if it is None"""
+    if duarouter is not None:
+        route_with_duarouter(duarouter, netfile, trip_files, output_file)
+    else:
+        route_locally(netfile, trip_files, output_file)
+
+
+def routed_demand(scenario, use_cache=True, router='auto', cache_dir=None):
+    """Returns the route file of the scenario's trips, routed at most once
+    per version of the net and trip files"""
+    duarouter = find_router(router)
+    used = 'duarouter' if duarouter is not None else 'local'
+    path = cache.entry_path(
+        'routes', scenario.name,
+        cache.digest([scenario.net] + list(scenario.trips), ROUTING_VERSION, used),
+        extension='.rou.xml', cache_dir=cache_dir)
+    if use_cache and os.path.exists(path):
+        return path
+    handle, temp_path = cache.new_entry(path)
+    os.close(handle)
+    try:
+        route_trips(duarouter, scenario.net, scenario.trips, temp_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    cache.commit_entry(temp_path, path)
+    return path
+
+
+def get_options(args=None):
+    optParser = optparse.OptionParser(usage="%prog [options] <scenario> ...")
+    optParser.add_option("--router", type="choice", choices=ROUTERS, default="auto",
+                         help="duarouter, the local router or duarouter when installed [default: %default]")
+    optParser.add_option("--force", action="store_true", default=False,
+                         help="route again even if the cached routes are current")
+    options, args = optParser.parse_args(args)
+    if not args:
+        optParser.error("expected scenarios")
+    options.scenarios = args
+    return options
+
+
+def main(args=None):
+    options = get_options(args)
+    for name in options.scenarios:
+        scenario = scenarios.get_scenario(name)
+        if not scenario.trips:
+            print("{0}: no trips to route".format(name))
+            continue
+        print("{0}: {1}".format(name, routed_demand(scenario, not options.force, options.router)))
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+"""Runs the seeds of a scenario with or without the priority lane algorithm.
+
+    python -m sumosim.runner grid-4 --nogui --algorithm
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import sys
+import optparse
+
+from sumosim import scenarios
+from sumosim.backend import BACKENDS, traci, select as select_backend, start as start_sumo
+from sumosim.network import load_network
+from sumosim.routing import routed_demand
+from sumosim.snapshots import warmup_state
+from sumosim.scheduling import SCHEDULES, ControlSchedule, demand_files, priority_demand
+from sumosim.controller import PriorityLaneController
+from sumosim.instrumentation import Instrumentation, Profiler
+from sumosim.progress import NORMAL, ProgressReporter
+
+
+#main execution loop to control each simulation step
+def simulate(controller=None, reporter=None, step=0, schedule=None):
+    """execute the TraCI control loop, handing every step to the controller,
+    or the steps the ControlSchedule 'schedule' picks, see sumosim.scheduling.
+    'step' is the number of the first step, after a warm-up"""
+    if controller is not None:
+        controller.start()
+    if schedule is not None:
+        schedule.start(traci.simulation.getTime(), traci.simulation.getDeltaT())
+    expected = traci.simulation.getMinExpectedNumber()
+    if reporter is not None:
+        reporter.start(expected, step)
+    while expected > 0:
+        steps = 1
+        if controller is not None:
+            controller.step(step)
+            if schedule is not None:
+                steps = schedule.advance(controller)
+        if steps > 1:
+            traci.simulationStep(schedule.time())
+        else:
+            traci.simulationStep()
+        step += steps
+        expected = traci.simulation.getMinExpectedNumber()
+        if reporter is not None:
+            reporter.update(step, expected, controller)
+    if controller is not None:
+        controller.finish()
+    if reporter is not None:
+        reporter.finish(step, controller, schedule)
+    traci.close()
+    sys.stdout.flush()
+    return step
+
+
+def scenario_routes(scenario, preroute=True, use_cache=True):
+    """Returns the cached routes of the scenario's trips, or None"""
+    if preroute and scenario.trips:
+        return routed_demand(scenario, use_cache)
+    return None
+
+
+def prepare_warmup(scenario, seed, warmup, preroute=True, use_cache=True, backend='traci',
+                   port=None, label="default"):
+    """Simulates and caches the warm-up of the seed unless it is cached,
+    returns (state file, warm-up steps)"""
+    return warmup_state(scenario, seed, warmup, scenario_routes(scenario, preroute, use_cache),
+                        use_cache, backend, port, label)
+
+
+def run(scenario, seed, algorithm=False, subscriptions=True, gui=False,
+        output_file=None, port=None, label="default", use_cache=True,
+        timing=False, profile=False, reporter=None, store=None, controller_options=None,
+        backend='traci', instrumentation=None, preroute=True, warmup=0, schedule_options=None,
+        output_tag=None):
+    """Runs one seed of the scenario and returns its tripinfo output file.
+
+    With 'timing' the phase timings of every step are printed and written
+    next to the output file (.timing.json, .timeline.csv), with 'profile'
+    the run is profiled into a .prof file there. Progress goes to 'reporter',
+    a ProgressReporter writing to stdout by default. With a 'store' the trips
+    are also written to that sumosim.store.ResultStore, under 'output_tag',
+    which also tells apart the default output file. 'controller_options'
+    are passed on to the PriorityLaneController. 'backend' names the SUMO
+    binding, see sumosim.backend. A given 'instrumentation' collects the
+    timings and TraCI calls of the run without printing or writing them.
+    With 'preroute' the scenario's trips are replaced by their cached routes,
+    see sumosim.routing. With 'warmup' seconds the run starts from the cached
+    warm-up state of the scenario and seed, see sumosim.snapshots.
+    'schedule_options' are passed on to the ControlSchedule of the
+    controller, see sumosim.scheduling"""
+    if output_file is None:
+        output_file = scenario.output_file(algorithm, seed, tag=output_tag)
+    output_base = os.path.splitext(output_file)[0]
+    if reporter is None:
+        reporter = ProgressReporter(label=label)
+    controller = None
+    if algorithm:
+        controller = PriorityLaneController(
+            load_network(scenario.net, use_cache), subscriptions, **(controller_options or {}))
+    if instrumentation is None and timing:
+        instrumentation = Instrumentation()
+    if instrumentation is not None:
+        if controller is not None:
+            controller = instrumentation.wrap(controller)
+    cmd = ["sumo-gui" if gui else "sumo", "-c", scenario.config,
+           "--tripinfo-output", output_file, "--seed", str(seed)]
+    routes = scenario_routes(scenario, preroute, use_cache)
+    if routes is not None:
+        cmd += ["--route-files", routes]
+    schedule = None
+    if controller is not None and schedule_options:
+        schedule_options = dict(schedule_options)
+        if schedule_options.get('mode') == 'event':
+            departures, vehicles, flows = priority_demand(scenario.name,
+                                                         demand_files(scenario, routes))
+            schedule_options.update(departures=departures, vehicles=vehicles, flows=flows)
+        schedule = ControlSchedule(**schedule_options)
+    first_step = 0
+    if warmup:
+        state, first_step = prepare_warmup(scenario, seed, warmup, preroute, use_cache, backend,
+                                           port, label)
+        cmd += ["--load-state", state]
+    select_backend(backend, gui)
+    start_sumo(cmd, port=port, label=label)
+    if instrumentation is not None:
+        instrumentation.install()
+    try:
+        with Profiler(output_base + '.prof' if profile else None):
+            simulate(controller, reporter, first_step, schedule)
+    finally:
+        if instrumentation is not None:
+            instrumentation.uninstall()
+    if timing:
+        print(instrumentation.report())
+        instrumentation.write(output_base + '.timing.json', output_base + '.timeline.csv')
+    if store is not None:
+        store.write(scenario.name, seed, algorithm, output_file, output_tag)
+    return output_file
+
+
+def get_options(args=None):
+    optParser = optparse.OptionParser(usage="%prog [options] <scenario>")
+    optParser.add_option("--nogui", action="store_true",
+                         default=False, help="run the commandline version of sumo")
+    optParser.add_option("--algorithm", action="store_true",
+                         default=False, help="run the priority lane algorithm instead of vanilla sumo")
+    optParser.add_option("--polling", action="store_true",
+                         default=False, help="query TraCI per edge/lane instead of using subscriptions")
+    optParser.add_option("--backend", type="choice", choices=BACKENDS, default="traci",
+                         help="SUMO binding, libsumo runs SUMO in process and falls back "
+                              "to traci when missing [default: %default]")
+    optParser.add_option("--no-cache", action="store_false", dest="cache",
+                         default=True, help="parse the net file instead of using the cached network model")
+    optParser.add_option("--no-preroute", action="store_false", dest="preroute",
+                         default=True, help="let SUMO route the scenario's trips at insertion")
+    optParser.add_option("--warmup", type="float", default=0,
+                         help="seconds simulated once per seed without the algorithm and "
+                              "shared by all runs through a cached state snapshot [default: %default]")
+    optParser.add_option("--timing", action="store_true",
+                         default=False, help="time every step and count the TraCI calls of each run")
+    optParser.add_option("--profile", action="store_true",
+                         default=False, help="dump a cProfile of each run next to its output")
+    optParser.add_option("--verbosity", type="int", default=NORMAL,
+                         help="0 for no progress, 1 for periodic progress, 2 to add the "
+                              "algorithm's action counters to every report [default: %default]")
+    optParser.add_option("--progress-interval", type="float", default=10.,
+                         help="seconds of wall time between progress reports [default: %default]")
+    optParser.add_option("--progress-file",
+                         help="append the JSON progress lines to this file instead of stdout")
+    optParser.add_option("--store", action="store_true",
+                         default=False, help="also write the trips of each run to the columnar result store")
+    optParser.add_option("--reroute-cooldown", type="int", default=0,
+                         help="steps before a vehicle may be rerouted again [default: %default]")
+    optParser.add_option("--reroute-budget", type="int",
+                         help="maximum reroutes per step, the others wait [default: unlimited]")
+    optParser.add_option("--reroute-filter", action="store_true", default=False,
+                         help="only reroute vehicles whose remaining route uses an edge changed in the step")
+    optParser.add_option("--travel-time-model", action="store_true", default=False,
+                         help="push smoothed travel time estimates of all edges instead of "
+                              "re-sending SUMO's own per changed edge")
+    optParser.add_option("--travel-time-alpha", type="float", default=0.5,
+                         help="smoothing factor of the travel time estimates [default: %default]")
+    optParser.add_option("--travel-time-threshold", type="float", default=0.1,
+                         help="relative change of an estimate before it is pushed [default: %default]")
+    optParser.add_option("--corridor-hops", type="int", default=0,
+                         help="also close the priority lanes up to this many links ahead "
+                              "of a priority vehicle [default: %default]")
+    optParser.add_option("--decision-kernel", action="store_true", default=False,
+                         help="pick the edges to close and open in one vectorized pass")
+    optParser.add_option("--schedule", type="choice", choices=SCHEDULES, default="every-step",
+                         help="steps the algorithm runs at, one of {0} [default: %default]".format(
+                             ', '.join(SCHEDULES)))
+    optParser.add_option("--control-interval", type="int", default=1,
+                         help="interval schedule: steps between control steps [default: %default]")
+    optParser.add_option("--idle-period", type="int", default=60,
+                         help="event schedule: most steps fast-forwarded while the algorithm "
+                              "cannot act [default: %default]")
+    optParser.add_option("--output-tag",
+                         help="add this tag to the output file and result dataset names, to keep runs "
+                              "with other settings")
+    optParser.add_option("--seeds",
+                         help="comma separated seeds to run [default: the scenario's seeds]")
+    options, args = optParser.parse_args(args)
+    if options.travel_time_model and options.polling:
+        optParser.error("--travel-time-model needs subscriptions, drop --polling")
+    if options.decision_kernel and options.polling:
+        optParser.error("--decision-kernel needs subscriptions, drop --polling")
+    if options.control_interval < 1 or options.idle_period < 1:
+        optParser.error("--control-interval and --idle-period are at least one step")
+    if len(args) != 1:
+        optParser.error("expected one scenario, known: {0}".format(
+            ', '.join(sorted(scenarios.load_scenarios()))))
+    try:
+        options.scenario = scenarios.get_scenario(args[0])
+    except KeyError as error:
+        optParser.error(error.args[0])
+    if options.seeds is None:
+        options.seeds = options.scenario.seeds
+    else:
+        options.seeds = [int(seed) for seed in options.seeds.split(',')]
+    return options
+
+
+def main(args=None):
+    options = get_options(args)
+    progress = open(options.progress_file, 'a') if options.progress_file else sys.stdout
+    store = None
+    if options.store:
+        # numpy is only needed for the result store
+        from sumosim.store import ResultStore
+        store = ResultStore()
+    controller_options = {
+        'reroute_cooldown': options.reroute_cooldown,
+        'reroute_budget': options.reroute_budget,
+        'reroute_filter': options.reroute_filter,
+        'travel_time_model': options.travel_time_model,
+        'travel_time_alpha': options.travel_time_alpha,
+        'travel_time_threshold': options.travel_time_threshold,
+        'corridor_hops': options.corridor_hops,
+        'decision_kernel': options.decision_kernel,
+    }
+    schedule_options = None
+    if options.schedule != 'every-step':
+        schedule_options = {
+            'mode': options.schedule,
+            'interval': options.control_interval,
+            'idle_period': options.idle_period,
+        }
+    try:
+        for seed in options.seeds:
+            reporter = ProgressReporter(progress, options.progress_interval, options.verbosity,
+                                        label='{0}-{1}'.format(options.scenario.name, seed))
+            run(options.scenario, seed, options.algorithm, not options.polling, not options.nogui,
+                output_tag=options.output_tag, use_cache=options.cache, timing=options.timing,
+                profile=options.profile, reporter=reporter, store=store,
+                controller_options=controller_options, backend=options.backend,
+                preroute=options.preroute, warmup=options.warmup,
+                schedule_options=schedule_options)
+    finally:
+        if progress is not sys.stdout:
+            progress.close()
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Registry of the scenarios bundled with the repository.
+
+A scenario is a directory holding a scenario.json next to its SUMO files:
+
+    {
+        "name": "grid-4",
+        "config": "grid-4.sumocfg",
+        "net": "grid-4.net.xml",
+        "output_prefix": "grid-4-ouput",
+        "seeds": [0, 1, 2],
+        "trips": ["osm.passenger.trips.xml"]
+    }
+
+File names are relative to the directory. Adding a network only takes a new
+directory with a scenario.json, no code. The optional trips are routed once
+before the runs, see sumosim.routing.
+"""
+from __future__ import absolute_import
+
+import os
+import json
+import glob
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIO_FILE = 'scenario.json'
+
+
+class Scenario(namedtuple('Scenario', ['name', 'directory', 'config', 'net', 'output_prefix', 'seeds',
+                                         'trips'])):
+    """A scenario with the absolute paths of its files"""
+
+    __slots__ = ()
+
+    def output_file(self, algorithm, seed, extension='.xml', tag=None):
+        """Returns the tripinfo output file of a run, 'tag' tells apart runs
+        of the same variant with different settings"""
+        variant = 'algorithm' if algorithm else 'no-algorithm'
+        if tag:
+            variant += '-' + tag
+        return os.path.join(self.directory, '{0}-{1}-{2}{3}'.format(
+            self.output_prefix, variant, seed, extension))
+
+
+def config_inputs(config, options=('net-file', 'route-files', 'additional-files')):
+    """Returns the files of the given options of a sumocfg, by default the
+    net, route and additional files it loads"""
+    directory = os.path.dirname(os.path.abspath(config))
+    inputs = []
+    for element in ElementTree.parse(config).getroot().iter():
+        if element.tag in options and element.get('value'):
+            inputs.extend(os.path.join(directory, name.strip())
+                          for name in element.get('value').split(','))
+    return inputs
+
+
+def load_scenario(path):
+    """Reads a scenario.json"""
+    directory = os.path.dirname(os.path.abspath(path))
+    with open(path) as scenario_file:
+        data = json.load(scenario_file)
+    return Scenario(
+        name=data.get('name', os.path.basename(directory)),
+        directory=directory,
+        config=os.path.join(directory, data['config']),
+        net=os.path.join(directory, data['net']),
+        output_prefix=data['output_prefix'],
+        seeds=tuple(data.get('seeds', (0, 1, 2))),
+        trips=tuple(os.path.join(directory, trips) for trips in data.get('trips', ())))
+
+
+def load_scenarios(root=ROOT):
+    """Returns the scenarios found one directory below root, by name"""
+    scenarios = {}
+    for path in sorted(glob.glob(os.path.join(root, '*', SCENARIO_FILE))):
+        scenario = load_scenario(path)
+        if scenario.name in scenarios:
+            raise ValueError("scenario '{0}' is declared twice".format(scenario.name))
+        scenarios[scenario.name] = scenario
+    return scenarios
+
+
+def get_scenario(name, root=ROOT):
+    """Returns the named scenario"""
+    scenarios = load_scenarios(root)
+    if name not in scenarios:
+        raise KeyError("unknown scenario '{0}', known: {1}".format(
+            name, ', '.join(sorted(scenarios))))
+    return scenarios[name]
@@ -0,0 +1,169 @@
+"""When the controller takes part in the simulation.
+
+    every-step  the controller runs before every simulation step
+    interval    the controller runs every 'interval' steps and SUMO is
+                advanced to the next control step at once
+    event       the controller runs every step while it can act. While it
+                cannot, with no bus, emergency vehicle or taxi in the network
+                or waiting to be inserted and no reroutes waiting, SUMO is
+                fast-forwarded to the next departure of a priority vehicle
+                in the demand files, by at most 'idle_period' steps
+
+SUMO is advanced with simulationStep(time), several steps in one call. The
+controller finds the vehicles that departed and arrived in the steps it did
+not see when it runs again. Lanes are only opened at control steps, so a
+lane may stay closed for up to 'interval' or 'idle_period' steps longer than
+when the controller runs every step; 'idle_period' bounds that delay in the
+event mode. The travel time model only observes the control steps.
+
+The priority departures are read from the vehicles and trips of the route
+and additional files. Priority flows keep the controller running every step
+from their begin to their end, as their vehicles are not known in advance.
+The departures are cached keyed by the contents of the files.
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+import bisect
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+from sumosim import cache
+from sumosim.backend import traci
+from sumosim.network import PRIORITY_TYPES
+from sumosim.scenarios import config_inputs
+
+SCHEDULES = ('every-step', 'interval', 'event')
+# bump whenever the way the departures are read changes to invalidate the cache
+SCHEDULE_VERSION = 1
+DEFAULT_VCLASS = 'passenger'
+
+
+def demand_files(scenario, routes=None):
+    """Returns the route and additional files of a run of the scenario, with
+    'routes' replacing the configured route files"""
+    additional = config_inputs(scenario.config, ('additional-files',))
+    if routes:
+        return [routes] + additional
+    return config_inputs(scenario.config, ('route-files',)) + additional
+
+
+def read_priority_demand(paths):
+    """Returns the sorted departure times and the IDs of the priority
+    vehicles and trips in the files, and the (begin, end) of the priority
+    flows. A departure that is not a time, like 'triggered', is returned as
+    a flow over the whole run"""
+    vclasses = {}
+    vehicles = []
+    for path in paths:
+        for _, element in ElementTree.iterparse(path):
+            if element.tag == 'vType':
+                vclasses[element.get('id')] = element.get('vClass', DEFAULT_VCLASS)
+            elif element.tag in ('vehicle', 'trip', 'flow'):
+                vehicles.append((element.tag, dict(element.attrib)))
+            if element.tag in ('vType', 'vehicle', 'trip', 'flow'):
+                element.clear()
+    departures = []
+    ids = set()
+    flows = []
+    for tag, attributes in vehicles:
+        if vclasses.get(attributes.get('type'), DEFAULT_VCLASS) not in PRIORITY_TYPES:
+            continue
+        if tag == 'flow':
+            flows.append((float(attributes.get('begin', 0)),
+                          float(attributes.get('end', float('inf')))))
+            continue
+        try:
+            departures.append(float(attributes.get('depart', 0)))
+        except ValueError:
+            flows.append((0., float('inf')))
+            continue
+        ids.add(attributes['id'])
+    return sorted(departures), ids, flows
+
+
+def priority_demand(name, paths, cache_dir=None):
+    """Returns read_priority_demand of the files of the scenario 'name', cached"""
+    path = cache.entry_path('schedule', '{0}-priority-demand'.format(name),
+                            cache.digest(paths, SCHEDULE_VERSION), cache_dir=cache_dir)
+    demand = cache.load_pickle(path)
+    if demand is None:
+        demand = read_priority_demand(paths)
+        cache.dump_pickle(demand, path)
+    return demand
+
+
+class ControlSchedule(object):
+    """Picks the steps the controller runs at, see the module documentation.
+
+    'fast_forwards' counts the simulationStep calls that advanced more than
+    one step and 'skipped' the steps the controller did not run at"""
+
+    def __init__(self, mode='every-step', interval=1, idle_period=60, departures=(),
+                 vehicles=(), flows=()):
+        if mode not in SCHEDULES:
+            raise ValueError("unknown schedule '{0}', expected one of {1}".format(
+                mode, ', '.join(SCHEDULES)))
+        if interval < 1 or idle_period < 1:
+            raise ValueError("the control interval and idle period are at least one step")
+        self.mode = mode
+        self.interval = interval
+        self.idle_period = idle_period
+        self.departures = list(departures)
+        self.vehicles = frozenset(vehicles)
+        self.flows = list(flows)
+        self.begin = 0.
+        self.delta_t = 1.
+        self.steps = 0
+        self.fast_forwards = 0
+        self.skipped = 0
+
+    def start(self, time, delta_t):
+        """Called before the first step with the simulation time and step length"""
+        self.begin = time
+        self.delta_t = delta_t
+        self.steps = 0
+
+    def time(self):
+        """Returns the simulation time at the next control step"""
+        return self.begin + self.steps * self.delta_t
+
+    def advance(self, controller):
+        """Called after the controller ran, returns the number of steps to
+        simulate before it runs again"""
+        if self.mode == 'every-step':
+            steps = 1
+        elif self.mode == 'interval':
+            steps = self.interval
+        else:
+            steps = self._idle_steps(controller)
+        self.steps += steps
+        if steps > 1:
+            self.fast_forwards += 1
+            self.skipped += steps - 1
+        return steps
+
+    def _idle_steps(self, controller):
+        if not controller.idle():
+            return 1
+        now = self.time()
+        for begin, end in self.flows:
+            if begin <= now + self.idle_period * self.delta_t and now <= end:
+                return 1
+        if self.vehicles and not self.vehicles.isdisjoint(traci.simulation.getPendingVehicles()):
+            return 1
+        steps = self.idle_period
+        position = bisect.bisect_left(self.departures, now)
+        if position < len(self.departures):
+            # run again right after the step that inserts the vehicle
+            steps = min(steps, int((self.departures[position] - now) / self.delta_t + 1e-9) + 1)
+        return max(steps, 1)
+
+    def stats(self):
+        return {
+            'fast_forwards': self.fast_forwards,
+            'skipped_steps': self.skipped,
+        }
@@ -0,0 +1,70 @@
+"""Warm-up state snapshots shared by the runs of a scenario and seed.
+
+The first 'warmup' seconds of a run are the same for the algorithm and the
+baseline, as the algorithm only takes part after the warm-up. They are
+simulated once per scenario, seed and warm-up length, without the algorithm,
+and the SUMO state at the end of the warm-up is saved, random number
+generators included. Every run of that scenario and seed then loads the
+state and starts from there.
+
+The controller's tables at the fork are the ones derived from the net file,
+since nothing changed the lane permissions during the warm-up, so the
+snapshot only records the state file and the number of warm-up steps, which
+the control loop continues to count from.
+
+Snapshots are cached keyed by the contents of the files the sumocfg loads,
+the pre-routed demand, the seed and the warm-up length. The tripinfo output
+of a forked run holds the trips that arrive after the warm-up.
+"""
+from __future__ import absolute_import
+
+import os
+
+from sumosim import cache
+from sumosim.scenarios import config_inputs
+from sumosim.backend import traci, select as select_backend, start as start_sumo
+
+# bump whenever the way the state is saved changes to invalidate the cache
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_paths(scenario, seed, warmup, routes=None, cache_dir=None):
+    """Returns the paths of the snapshot record and state file"""
+    inputs = [scenario.config] + config_inputs(scenario.config) + ([routes] if routes else [])
+    key = cache.digest([path for path in inputs if os.path.exists(path)],
+                       seed, warmup, SNAPSHOT_VERSION)
+    name = '{0}-{1}-{2}'.format(scenario.name, seed, warmup)
+    return (cache.entry_path('state', name, key, cache_dir=cache_dir),
+            cache.entry_path('state', name + '-state', key, extension='.xml.gz', cache_dir=cache_dir))
+
+
+def warmup_state(scenario, seed, warmup, routes=None, use_cache=True, backend='traci',
+                 port=None, label="default", cache_dir=None):
+    """Returns (state file, warm-up steps) of the scenario and seed after
+    'warmup' seconds, simulating the warm-up unless it is cached"""
+    record_path, state_path = snapshot_paths(scenario, seed, warmup, routes, cache_dir)
+    if use_cache:
+        record = cache.load_pickle(record_path)
+        if record is not None and os.path.exists(state_path):
+            return state_path, record['steps']
+    cmd = ["sumo", "-c", scenario.config, "--seed", str(seed), "--save-state.rng"]
+    if routes:
+        cmd += ["--route-files", routes]
+    select_backend(backend)
+    start_sumo(cmd, port=port, label=label)
+    steps = 0
+    try:
+        while traci.simulation.getTime() < warmup and traci.simulation.getMinExpectedNumber() > 0:
+            traci.simulationStep()
+            steps += 1
+        handle, temp_path = cache.new_entry(state_path)
+        os.close(handle)
+        # SUMO picks the state format from the extension
+        temp_state = temp_path + '.xml.gz'
+        traci.simulation.saveState(temp_state)
+    finally:
+        traci.close()
+    os.remove(temp_path)
+    cache.commit_entry(temp_state, state_path)
+    cache.dump_pickle({'steps': steps, 'time': warmup}, record_path)
+    return state_path, steps
@@ -0,0 +1,40 @@
+"""Small descriptive statistics helpers, without numpy"""
+from __future__ import absolute_import
+from __future__ import division
+
+import math
+
+# two-sided 95% critical values of Student's t by degrees of freedom
+T_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+
+
+def mean(values):
+    return sum(values) / len(values) if len(values) else 0.
+
+
+def stdev(values):
+    """Sample standard deviation"""
+    if len(values) < 2:
+        return 0.
+    centre = mean(values)
+    return math.sqrt(sum((value - centre) ** 2 for value in values) / (len(values) - 1))
+
+
+def confidence_interval(values):
+    """Half width of the 95% confidence interval of the mean"""
+    if len(values) < 2:
+        return 0.
+    t = T_95[len(values) - 2] if len(values) - 1 <= len(T_95) else 1.96
+    return t * stdev(values) / math.sqrt(len(values))
+
+
+def percentile(sorted_values, q):
+    """Returns the q-th percentile of the sorted values, interpolating linearly"""
+    if not len(sorted_values):
+        return 0.
+    position = (len(sorted_values) - 1) * q / 100.
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
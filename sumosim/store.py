@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""Columnar store of the trips of every run.
+
+Each run is a dataset directory results/<scenario>/<variant>-<seed>/ with one
+.npy file per tripinfo attribute and a dataset.json holding the tags
+(scenario, seed, algorithm, output tag), the column types and the dictionaries of the
+string columns, which are stored as int32 codes (-1 when missing). Columns
+are loaded one at a time and memory-mapped, so an analysis only reads what
+it uses.
+
+    python -m sumosim.store import grid-4 grid-10
+    python -m sumosim.store list
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import json
+import glob
+import shutil
+import optparse
+import tempfile
+from array import array
+
+import numpy as np
+
+from sumosim import scenarios
+from sumosim.metrics import iter_tripinfos
+
+STORE_DIR = os.path.join(scenarios.ROOT, 'results')
+DATASET_FILE = 'dataset.json'
+# every other tripinfo attribute is stored as a dictionary encoded string
+NUMERIC = frozenset([
+    'depart', 'departPos', 'departSpeed', 'departDelay', 'arrival', 'arrivalPos',
+    'arrivalSpeed', 'duration', 'routeLength', 'waitSteps', 'waitingTime',
+    'waitingCount', 'stopTime', 'timeLoss', 'rerouteNo', 'speedFactor',
+])
+
+
+class ColumnBuilder(object):
+    """Accumulates the values of one column while the trips are streamed"""
+
+    def __init__(self, name, rows):
+        self.name = name
+        self.numeric = name in NUMERIC
+        if self.numeric:
+            self.values = array('d', [float('nan')] * rows)
+        else:
+            self.values = array('i', [-1] * rows)
+            self.dictionary = {}
+
+    def append(self, value):
+        if value is None:
+            self.values.append(float('nan') if self.numeric else -1)
+        elif self.numeric:
+            self.values.append(float(value))
+        else:
+            self.values.append(self.dictionary.setdefault(value, len(self.dictionary)))
+
+    def save(self, directory):
+        dtype = np.float64 if self.numeric else np.int32
+        np.save(os.path.join(directory, self.name + '.npy'), np.frombuffer(self.values, dtype=dtype))
+        if self.numeric:
+            return {'type': 'float64'}
+        strings = sorted(self.dictionary, key=self.dictionary.get)
+        return {'type': 'dictionary', 'dictionary': strings}
+
+
+class Dataset(object):
+    """The trips of one run"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, DATASET_FILE)) as meta_file:
+            self.meta = json.load(meta_file)
+        self.scenario = self.meta['scenario']
+        self.seed = self.meta['seed']
+        self.algorithm = self.meta['algorithm']
+        # datasets stored before the tag was recorded are untagged
+        self.tag = self.meta.get('tag')
+        self.rows = self.meta['rows']
+        self.columns = sorted(self.meta['columns'])
+
+    def column(self, name):
+        """Returns the values, or the dictionary codes, of a column memory-mapped"""
+        return np.load(os.path.join(self.directory, name + '.npy'), mmap_mode='r')
+
+    def dictionary(self, name):
+        """Returns the strings of a dictionary encoded column by code"""
+        return self.meta['columns'][name]['dictionary']
+
+    def strings(self, name):
+        """Returns the decoded values of a string column, None where missing"""
+        lookup = np.array(self.dictionary(name) + [None], dtype=object)
+        return lookup[np.asarray(self.column(name))]
+
+    def load(self, names):
+        """Returns the named columns by name"""
+        return dict((name, self.column(name)) for name in names)
+
+
+class ResultStore(object):
+    """Datasets of all runs, tagged with scenario, seed, algorithm flag and
+    the output tag of the run, see sumosim.runner --output-tag"""
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+
+    def dataset_dir(self, scenario, seed, algorithm, tag=None):
+        variant = 'algorithm' if algorithm else 'no-algorithm'
+        if tag:
+            variant += '-' + tag
+        return os.path.join(self.root, scenario, '{0}-{1}'.format(variant, seed))
+
+    def write(self, scenario, seed, algorithm, tripinfo_file, tag=None):
+        """Stores the trips of a tripinfo output, replacing an older dataset of
+        the same run and tag, and returns the dataset"""
+        builders = {}
+        rows = 0
+        for trip in iter_tripinfos(tripinfo_file):
+            for name in trip:
+                if name not in builders:
+                    builders[name] = ColumnBuilder(name, rows)
+            for name, builder in builders.items():
+                builder.append(trip.get(name))
+            rows += 1
+
+        target = self.dataset_dir(scenario, seed, algorithm, tag)
+        parent = os.path.dirname(target)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        temp_dir = tempfile.mkdtemp(dir=parent)
+        meta = {
+            'scenario': scenario,
+            'seed': seed,
+            'algorithm': algorithm,
+            'tag': tag,
+            'rows': rows,
+            'source': os.path.abspath(tripinfo_file),
+            'columns': dict((name, builder.save(temp_dir)) for name, builder in builders.items()),
+        }
+        with open(os.path.join(temp_dir, DATASET_FILE), 'w') as meta_file:
+            json.dump(meta, meta_file, indent=2, sort_keys=True)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.rename(temp_dir, target)
+        return Dataset(target)
+
+    def datasets(self, scenario=None, algorithm=None, seed=None, tag=None):
+        """Returns the stored datasets matching the given tags"""
+        found = []
+        pattern = os.path.join(self.root, scenario or '*', '*', DATASET_FILE)
+        for path in sorted(glob.glob(pattern)):
+            dataset = Dataset(os.path.dirname(path))
+            if algorithm is not None and dataset.algorithm != algorithm:
+                continue
+            if seed is not None and dataset.seed != seed:
+                continue
+            if tag is not None and dataset.tag != tag:
+                continue
+            found.append(dataset)
+        return found
+
+
+def import_scenario(store, scenario):
+    """Stores the existing tripinfo outputs of both variants of a scenario"""
+    imported = []
+    for algorithm in (True, False):
+        for seed in scenario.seeds:
+            output_file = scenario.output_file(algorithm, seed)
+            if os.path.exists(output_file):
+                imported.append(store.write(scenario.name, seed, algorithm, output_file))
+    return imported
+
+
+def get_options(args=None):
+    optParser = optparse.OptionParser(usage="%prog [options] import <scenario> ... | list")
+    optParser.add_option("--store", default=STORE_DIR,
+                         help="directory of the result store [default: %default]")
+    options, args = optParser.parse_args(args)
+    if not args or args[0] not in ('import', 'list'):
+        optParser.error("expected 'import <scenario> ...' or 'list'")
+    options.command = args[0]
+    options.args = args[1:]
+    return options
+
+
+def main(args=None):
+    options = get_options(args)
+    store = ResultStore(options.store)
+    if options.command == 'import':
+        for name in options.args:
+            for dataset in import_scenario(store, scenarios.get_scenario(name)):
+                print("{0}: {1} trips".format(dataset.directory, dataset.rows))
+    else:
+        for dataset in store.datasets():
+            print("{0:<16} {1:<13} {2:<12} seed {3:<3} {4:7d} trips  {5}".format(
+                dataset.scenario, 'algorithm' if dataset.algorithm else 'no-algorithm',
+                dataset.tag or '-', dataset.seed, dataset.rows, ', '.join(dataset.columns)))
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    main()
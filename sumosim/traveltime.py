@@ -0,0 +1,87 @@
+"""Travel time model of every edge, kept in the controller.
+
+update_edge_travel_time reads the travel time of an edge back from SUMO
+and writes it again through adaptTraveltime, two round trips per edge. The
+TravelTimeModel instead estimates the travel time of all edges at once from
+the mean speed and occupancy of the per-step snapshot:
+
+    observed = length / max(mean speed, MIN_SPEED), free flow when empty
+    estimate = alpha * observed + (1 - alpha) * estimate
+
+and only pushes the edges whose estimate moved more than 'threshold'
+(relative) away from the value last pushed to SUMO. The estimates are NumPy
+arrays indexed by the position of the edge in the network, so a step is a
+few vectorized operations however large the network is.
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+import numpy as np
+
+import traci.constants as tc
+
+from sumosim.backend import traci
+from sumosim.actuation import submit
+
+# m/s, bounds the estimate of a standing edge
+MIN_SPEED = 0.1
+
+
+class TravelTimeModel(object):
+    """Exponentially smoothed travel time of every edge of the network"""
+
+    def __init__(self, network, alpha=0.5, threshold=0.1):
+        self.edge_ids = network.edge_ids
+        self.alpha = alpha
+        self.threshold = threshold
+        lengths = np.array([network.lengths[edge_id] for edge_id in self.edge_ids], dtype=np.float64)
+        speeds = np.array([network.speeds[edge_id] for edge_id in self.edge_ids], dtype=np.float64)
+        self.lengths = lengths
+        self.free_flow = lengths / np.maximum(speeds, MIN_SPEED)
+        self.estimate = self.free_flow.copy()
+        # SUMO routes with the free flow times until told otherwise
+        self.pushed = self.free_flow.copy()
+        self.updates = 0
+        self.pushes = 0
+
+    def observe(self, edge_results):
+        """Updates the estimates from the edge subscription results of the
+        snapshot, {edge: {variable: value}}"""
+        count = len(self.edge_ids)
+        mean_speed = np.fromiter(
+            (edge_results[edge_id][tc.LAST_STEP_MEAN_SPEED] for edge_id in self.edge_ids),
+            np.float64, count)
+        occupancy = np.fromiter(
+            (edge_results[edge_id][tc.LAST_STEP_OCCUPANCY] for edge_id in self.edge_ids),
+            np.float64, count)
+        self.update(mean_speed, occupancy)
+
+    def update(self, mean_speed, occupancy):
+        """Folds the mean speeds and occupancies of the last step, arrays in
+        network order, into the estimates"""
+        observed = np.where(occupancy > 0, self.lengths / np.maximum(mean_speed, MIN_SPEED),
+                            self.free_flow)
+        self.estimate += self.alpha * (observed - self.estimate)
+        self.updates += 1
+
+    def changed(self):
+        """Returns the positions of the edges whose estimate moved past the threshold"""
+        return np.flatnonzero(np.abs(self.estimate - self.pushed) > self.threshold * self.pushed)
+
+    def push(self, commands=None):
+        """Sends the estimates that moved past the threshold to SUMO, queued
+        on 'commands' if given, returns the number of edges sent"""
+        changed = self.changed()
+        for position in changed.tolist():
+            edge_id = self.edge_ids[position]
+            submit(commands, 'adaptTraveltime', edge_id, traci.edge.adaptTraveltime,
+                   edge_id, float(self.estimate[position]))
+        self.pushed[changed] = self.estimate[changed]
+        self.pushes += len(changed)
+        return len(changed)
+
+    def stats(self):
+        return {
+            'travel_time_updates': self.updates,
+            'travel_time_pushes': self.pushes,
+        }
@@ -0,0 +1,108 @@
+"""Static attributes of the vehicles in the network.
+
+The class and type of a vehicle never change during its trip, so they are
+read from SUMO once, when the vehicle departs, and kept until it arrives.
+The algorithm's class checks are then lookups, and the cache never holds
+more than the vehicles currently in the network.
+
+The vehicles are numbered when they are first seen, see sumosim.interning,
+and the controller keys its per-vehicle state by those numbers. The number
+of an arrived vehicle goes to the next vehicle that departs.
+"""
+from __future__ import absolute_import
+
+from collections import namedtuple
+
+from sumosim.backend import traci
+from sumosim.interning import Interner
+from sumosim.network import PRIORITY_TYPES
+
+VehicleInfo = namedtuple('VehicleInfo', ['vehicle_class', 'vehicle_type', 'priority'])
+
+
+class VehicleCache(object):
+    """Numbers of the vehicles in the network and their VehicleInfo by number"""
+
+    def __init__(self):
+        self.numbers = Interner()
+        self.vehicle_ids = self.numbers.ids
+        # None until read from SUMO
+        self.infos = []
+        # numbers not read from SUMO yet, and the priority vehicles read
+        self.unread = set()
+        self.priority = 0
+        self.misses = 0
+
+    def number(self, vehicle):
+        """Returns the number of the vehicle, numbering it if it is new"""
+        number = self.numbers.intern(vehicle)
+        if number == len(self.infos):
+            self.infos.append(None)
+            self.unread.add(number)
+        elif self.infos[number] is None:
+            self.unread.add(number)
+        return number
+
+    def depart(self, vehicles):
+        """Reads the attributes of the vehicles that departed in the last step"""
+        for vehicle in vehicles:
+            number = self.number(vehicle)
+            if self.infos[number] is None:
+                self._store(number, self._read(vehicle))
+
+    def arrive(self, vehicles):
+        """Forgets the vehicles that arrived in the last step, returns the
+        numbers they had"""
+        numbers = []
+        for vehicle in vehicles:
+            number = self.numbers.release(vehicle)
+            if number is not None:
+                info = self.infos[number]
+                if info is not None and info.priority:
+                    self.priority -= 1
+                self.infos[number] = None
+                self.unread.discard(number)
+                numbers.append(number)
+        return numbers
+
+    def get(self, vehicle):
+        """Returns the VehicleInfo of the vehicle, read from SUMO if the
+        vehicle departed before the cache was filled"""
+        return self.info(self.number(vehicle))
+
+    def info(self, number):
+        """Returns the VehicleInfo of the vehicle with the number"""
+        info = self.infos[number]
+        if info is None:
+            self.misses += 1
+            info = self._store(number, self._read(self.vehicle_ids[number]))
+        return info
+
+    def priority_count(self):
+        """Returns the number of priority vehicles in the network, reading
+        the vehicles not read yet"""
+        for number in list(self.unread):
+            self.info(number)
+        return self.priority
+
+    def is_priority(self, vehicle):
+        """Returns whether the vehicle is a bus, emergency vehicle or taxi"""
+        return self.get(vehicle).priority
+
+    def _store(self, number, info):
+        self.infos[number] = info
+        self.unread.discard(number)
+        if info.priority:
+            self.priority += 1
+        return info
+
+    def _read(self, vehicle):
+        vehicle_class = traci.vehicle.getVehicleClass(vehicle)
+        return VehicleInfo(vehicle_class, traci.vehicle.getTypeID(vehicle),
+                           vehicle_class in PRIORITY_TYPES)
+
+    def stats(self):
+        return {
+            'vehicles_cached': len(self.numbers.numbers),
+            'vehicle_cache_misses': self.misses,
+        }